@@ -0,0 +1,101 @@
+"""
+Davia app driven by the benchmarks.
+
+It serves sync, async and CPU-bound tasks, registers a graph, and stands in for
+the `/assistants/*` routes of langgraph-api so the graph routes run offline.
+"""
+
+import asyncio
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Optional, TypedDict
+
+from langgraph.graph import END, START, StateGraph
+from pydantic import BaseModel
+
+from davia import Davia
+
+# Number of assistant versions returned by the fake `/assistants/search`
+ASSISTANT_VERSIONS = int(os.getenv("BENCH_ASSISTANT_VERSIONS", "50"))
+
+app = Davia(title="Davia benchmarks")
+
+
+@app.task
+def echo_sync(text: str) -> str:
+    """Return the text, from the threadpool."""
+    return text
+
+
+@app.task
+async def echo_async(text: str) -> str:
+    """Return the text, from the event loop."""
+    await asyncio.sleep(0)
+    return text
+
+
+@app.task
+def fibonacci(n: int) -> int:
+    """Compute a Fibonacci number the slow way."""
+    return n if n < 2 else fibonacci(n - 1) + fibonacci(n - 2)
+
+
+class BenchState(TypedDict):
+    messages: list[dict]
+
+
+def respond(state: BenchState) -> dict:
+    return {"messages": [*state["messages"], {"role": "assistant", "content": "ok"}]}
+
+
+@app.graph
+def bench_graph(config: Optional[dict] = None):
+    """A single node graph answering each message, inspected by the benchmarks."""
+    graph = StateGraph(BenchState)
+    graph.add_node("respond", respond)
+    graph.add_edge(START, "respond")
+    graph.add_edge("respond", END)
+    return graph
+
+
+_now = datetime.now(timezone.utc)
+# Newest first, like the runtime sorts them by creation time
+_assistants = [
+    {
+        "assistant_id": str(uuid.uuid5(uuid.NAMESPACE_URL, f"bench_graph/{version}")),
+        "graph_id": "bench_graph",
+        "version": version,
+        "created_at": (_now + timedelta(seconds=version)).isoformat(),
+        "updated_at": (_now + timedelta(seconds=version)).isoformat(),
+    }
+    for version in reversed(range(ASSISTANT_VERSIONS))
+]
+_state_schema = {
+    "title": "bench_graph_state",
+    "type": "object",
+    "properties": {"messages": {"type": "array", "items": {"type": "object"}}},
+}
+
+
+class AssistantSearch(BaseModel):
+    graph_id: Optional[str] = None
+    limit: int = 10
+    offset: int = 0
+
+
+@app.post("/assistants/search", include_in_schema=False)
+async def search_assistants(search: AssistantSearch) -> list[dict]:
+    """Stand-in for the langgraph-api assistants search."""
+    assistants = [
+        assistant
+        for assistant in _assistants
+        if search.graph_id is None or assistant["graph_id"] == search.graph_id
+    ]
+    return assistants[search.offset : search.offset + search.limit]
+
+
+@app.get("/assistants/{assistant_id}/schemas", include_in_schema=False)
+async def assistant_schemas(assistant_id: str) -> dict:
+    """Stand-in for the langgraph-api assistant schemas."""
+    return {"graph_id": "bench_graph", "state_schema": _state_schema}
@@ -0,0 +1,263 @@
+"""
+Benchmarks of the Davia HTTP surface.
+
+Starts `benchmarks/app.py` with uvicorn in a subprocess, drives each scenario at
+fixed concurrency levels and reports latency percentiles, throughput and the
+resident memory of the server. Results are saved per commit so they can be
+compared across commits:
+
+    python benchmarks/run.py run
+    python benchmarks/run.py compare benchmarks/results/<a>.json benchmarks/results/<b>.json
+"""
+
+import asyncio
+import importlib.util
+import inspect
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Optional
+
+import httpx
+import typer
+from rich import print
+from rich.table import Table
+from typing_extensions import Annotated
+
+ROOT = Path(__file__).resolve().parent
+RESULTS_DIR = ROOT / "results"
+
+SCENARIOS = {
+    "task_sync": ("POST", "/echo_sync?text=hello"),
+    "task_async": ("POST", "/echo_async?text=hello"),
+    "task_cpu": ("POST", "/fibonacci?n=15"),
+    "graph_schemas": ("GET", "/davia/graph-schemas"),
+    "graph_config": ("GET", "/davia/graph-config/bench_graph"),
+    "docs": ("GET", "/docs"),
+    "openapi": ("GET", "/openapi.json"),
+}
+
+app = typer.Typer(no_args_is_help=True)
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _rss_bytes(pid: int) -> Optional[int]:
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+def _percentile(latencies: list[float], q: float) -> float:
+    if not latencies:
+        return float("nan")
+    index = min(len(latencies) - 1, int(round(q * (len(latencies) - 1))))
+    return latencies[index]
+
+
+def _graph_docstring(app_file: str, name: str) -> Optional[str]:
+    """Get the docstring of a graph function of the benchmark app."""
+    spec = importlib.util.spec_from_file_location("davia_benchmark_app", app_file)
+    assert spec is not None and spec.loader is not None
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return inspect.getdoc(getattr(module, name))
+
+
+def _start_server(port: int) -> subprocess.Popen:
+    app_file = (ROOT / "app.py").as_posix()
+    env = {
+        **os.environ,
+        # What run_server sets for the graph routes
+        "LANGSERVE_GRAPHS": json.dumps({"bench_graph": f"{app_file}:bench_graph"}),
+        "DAVIA_GRAPHS": json.dumps(
+            {
+                "bench_graph": {
+                    "source_file": app_file,
+                    "docstring": _graph_docstring(app_file, "bench_graph"),
+                }
+            }
+        ),
+    }
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "app:app",
+            "--app-dir",
+            str(ROOT),
+            "--port",
+            str(port),
+            "--log-level",
+            "warning",
+            "--no-access-log",
+        ],
+        env=env,
+    )
+    for _ in range(100):
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/davia/info")
+            return server
+        except httpx.TransportError:
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError("The benchmark server did not start")
+
+
+async def _drive(
+    client: httpx.AsyncClient, method: str, path: str, concurrency: int, requests: int
+) -> dict:
+    latencies: list[float] = []
+    errors = 0
+    remaining = requests
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, path)
+            except httpx.TransportError:
+                # A failed connection is counted, the run goes on
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": requests,
+        "errors": errors,
+        "p50_ms": _percentile(latencies, 0.5) * 1000,
+        "p99_ms": _percentile(latencies, 0.99) * 1000,
+        "throughput_rps": requests / elapsed,
+    }
+
+
+async def _run(
+    port: int, scenarios: list[str], concurrency: list[int], requests: int, pid: int
+) -> list[dict]:
+    results = []
+    limits = httpx.Limits(max_connections=max(concurrency))
+    async with httpx.AsyncClient(
+        base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=60
+    ) as client:
+        for scenario in scenarios:
+            method, path = SCENARIOS[scenario]
+            # Warm up caches and connections before measuring
+            await _drive(client, method, path, max(concurrency), max(concurrency))
+            for level in concurrency:
+                result = await _drive(client, method, path, level, requests)
+                result.update(
+                    scenario=scenario, concurrency=level, rss_bytes=_rss_bytes(pid)
+                )
+                results.append(result)
+                print(
+                    f"{scenario:>14} c={level:<3} p50={result['p50_ms']:.2f}ms "
+                    f"p99={result['p99_ms']:.2f}ms {result['throughput_rps']:.0f} req/s "
+                    f"errors={result['errors']}"
+                )
+    return results
+
+
+@app.command()
+def run(
+    scenarios: Annotated[
+        Optional[list[str]],
+        typer.Option("--scenario", "-s", help="Scenarios to run, all by default."),
+    ] = None,
+    concurrency: Annotated[
+        Optional[list[int]],
+        typer.Option("--concurrency", "-c", help="Concurrency levels."),
+    ] = None,
+    requests: Annotated[
+        int, typer.Option(help="Requests per scenario and concurrency level.")
+    ] = 1000,
+    port: Annotated[int, typer.Option(help="Port of the benchmark server.")] = 2099,
+    output: Annotated[
+        Optional[Path],
+        typer.Option(help="Results file, benchmarks/results/<commit>.json by default."),
+    ] = None,
+):
+    """Run the benchmarks and save the results."""
+    scenarios = scenarios or list(SCENARIOS)
+    concurrency = concurrency or [1, 8, 32]
+    for scenario in scenarios:
+        if scenario not in SCENARIOS:
+            raise typer.BadParameter(f"Unknown scenario '{scenario}'")
+
+    server = _start_server(port)
+    try:
+        results = asyncio.run(_run(port, scenarios, concurrency, requests, server.pid))
+    finally:
+        server.terminate()
+        server.wait()
+
+    commit = _git_commit()
+    output = output or RESULTS_DIR / f"{commit}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(
+        json.dumps(
+            {
+                "commit": commit,
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "requests": requests,
+                "results": results,
+            },
+            indent=2,
+        )
+    )
+    print(f"Results saved to {output}")
+
+
+@app.command()
+def compare(baseline: Path, candidate: Path):
+    """Compare two results files."""
+    before = json.loads(baseline.read_text())
+    after = json.loads(candidate.read_text())
+    before_results = {(r["scenario"], r["concurrency"]): r for r in before["results"]}
+
+    table = Table(title=f"{before['commit']} -> {after['commit']}")
+    for column in ["scenario", "c", "p50 ms", "p99 ms", "req/s"]:
+        table.add_column(column)
+    for result in after["results"]:
+        previous = before_results.get((result["scenario"], result["concurrency"]))
+        if previous is None:
+            continue
+        table.add_row(
+            result["scenario"],
+            str(result["concurrency"]),
+            _change(previous["p50_ms"], result["p50_ms"]),
+            _change(previous["p99_ms"], result["p99_ms"]),
+            _change(previous["throughput_rps"], result["throughput_rps"]),
+        )
+    print(table)
+
+
+def _change(before: float, after: float) -> str:
+    return f"{before:.2f} -> {after:.2f} ({(after - before) / before:+.0%})"
+
+
+if __name__ == "__main__":
+    app()
@@ -1,5 +1,30 @@
 from davia.application import Davia
-from davia.state import State
+from davia.graphs import graph
+from davia.state import (
+    DiskStateBackend,
+    InMemoryStateBackend,
+    State,
+    StateBackend,
+    StateHandle,
+)
+from davia.retention import Retention
+from davia.admission import Admission
+from davia.profiling import Profiling
+from davia.cancellation import CancellationToken, TaskCancelled
 from davia._version import __version__
 
-__all__ = ["Davia", "State", "__version__"]
+__all__ = [
+    "Davia",
+    "graph",
+    "State",
+    "StateHandle",
+    "StateBackend",
+    "InMemoryStateBackend",
+    "DiskStateBackend",
+    "Retention",
+    "Admission",
+    "Profiling",
+    "CancellationToken",
+    "TaskCancelled",
+    "__version__",
+]
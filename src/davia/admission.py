@@ -0,0 +1,205 @@
+import asyncio
+import functools
+import math
+import time
+from typing import Callable, Optional
+
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+from davia.utils import set_signature, typed_signature
+
+# Paths never shed by the app-wide admission control, so probes keep answering
+# and long-lived event streams do not hold a slot
+EXEMPT_PATHS = {"/davia/info", "/davia/events", "/ok", "/info", "/health"}
+# Weight of the last request in the moving average of the latency
+_LATENCY_SMOOTHING = 0.2
+
+
+class Admission(BaseModel):
+    """
+    Admission control of a task, or of the whole app.
+
+    Requests above the rate limit are answered with a 429, and requests that
+    would wait too long for a slot with a 503, both with a `Retry-After` header.
+
+    ## Example
+
+    ```python
+    from davia import Admission, Davia
+
+    app = Davia(admission=Admission(max_concurrency=64, max_queued=256))
+
+    @app.task(admission=Admission(rate=5, burst=10, max_concurrency=2))
+    def summarize(text: str) -> str:
+        ...
+    ```
+    """
+
+    rate: Optional[float] = None
+    """Requests admitted per second on average."""
+    burst: Optional[int] = None
+    """Requests admitted at once above the rate, defaults to the rate."""
+    max_concurrency: Optional[int] = None
+    """Requests processed at the same time, the next ones wait for a slot."""
+    max_queued: Optional[int] = None
+    """Requests waiting for a slot, the next ones are rejected."""
+    max_queue_wait: Optional[float] = None
+    """Seconds a request is expected to wait for a slot above which it is rejected."""
+
+
+class Overloaded(Exception):
+    """A request was not admitted."""
+
+    def __init__(self, status_code: int, detail: str, retry_after: float):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+    @property
+    def headers(self) -> dict[str, str]:
+        return {"Retry-After": str(max(1, math.ceil(self.retry_after)))}
+
+
+class TokenBucket:
+    """Token bucket refilled at `rate` tokens per second, up to `burst` tokens."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """Take a token, returning 0 or the seconds until one is available."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class AdmissionController:
+    """Enforces an admission policy on the requests of a task or of the app."""
+
+    def __init__(self, admission: Admission):
+        self.admission = admission
+        self.bucket = (
+            TokenBucket(admission.rate, admission.burst or max(1.0, admission.rate))
+            if admission.rate
+            else None
+        )
+        self.active = 0
+        self.queued = 0
+        # Moving average of the time a request holds its slot
+        self.latency = 0.0
+        # Created on first use to be bound to the running event loop
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def expected_wait(self) -> float:
+        """Seconds a new request is expected to wait for a slot."""
+        if not self.admission.max_concurrency:
+            return 0.0
+        return (self.queued + 1) * self.latency / self.admission.max_concurrency
+
+    async def acquire(self):
+        """Wait for a slot, raising `Overloaded` if the request is not admitted."""
+        if self.bucket is not None:
+            wait = self.bucket.take()
+            if wait:
+                raise Overloaded(429, "Rate limit exceeded", wait)
+
+        max_concurrency = self.admission.max_concurrency
+        if not max_concurrency:
+            self.active += 1
+            return
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(max_concurrency)
+
+        if self.active >= max_concurrency:
+            expected_wait = self.expected_wait()
+            if (
+                self.admission.max_queued is not None
+                and self.queued >= self.admission.max_queued
+            ):
+                raise Overloaded(503, "Too many queued requests", expected_wait)
+            if (
+                self.admission.max_queue_wait is not None
+                and expected_wait > self.admission.max_queue_wait
+            ):
+                raise Overloaded(503, "Expected wait too long", expected_wait)
+
+        self.queued += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.queued -= 1
+        self.active += 1
+
+    def release(self, duration: float):
+        """Release the slot of a request that held it for `duration` seconds."""
+        self.active -= 1
+        if self._semaphore is not None:
+            self._semaphore.release()
+        self.latency += _LATENCY_SMOOTHING * (duration - self.latency)
+
+
+def admit(endpoint: Callable, controller: AdmissionController) -> Callable:
+    """Wrap a route endpoint to admit its requests through the controller."""
+    is_coroutine = asyncio.iscoroutinefunction(endpoint)
+
+    @functools.wraps(endpoint)
+    async def wrapper(*args, **kwargs):
+        try:
+            await controller.acquire()
+        except Overloaded as e:
+            raise HTTPException(e.status_code, e.detail, headers=e.headers)
+        start = time.monotonic()
+        try:
+            if is_coroutine:
+                return await endpoint(*args, **kwargs)
+            return await run_in_threadpool(endpoint, *args, **kwargs)
+        finally:
+            controller.release(time.monotonic() - start)
+
+    set_signature(wrapper, typed_signature(endpoint))
+    return wrapper
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware enforcing an admission policy on all the HTTP requests of an app.
+
+    Streamed responses hold their slot until the stream ends.
+    """
+
+    def __init__(
+        self, app, admission: Admission, exempt_paths: set[str] = EXEMPT_PATHS
+    ):
+        self.app = app
+        self.controller = AdmissionController(admission)
+        self.exempt_paths = exempt_paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exempt_paths:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await self.controller.acquire()
+        except Overloaded as e:
+            response = JSONResponse(
+                {"detail": e.detail}, status_code=e.status_code, headers=e.headers
+            )
+            await response(scope, receive, send)
+            return
+        start = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(time.monotonic() - start)
@@ -1,13 +1,43 @@
 import os
+import sys
+import copy
+import asyncio
+import logging
 import inspect
-from fastapi import FastAPI
+import functools
+from contextlib import asynccontextmanager
+from fastapi import APIRouter, FastAPI
+from fastapi.routing import APIRoute
 from fastapi.middleware.cors import CORSMiddleware
-from typing import Callable
+from typing import Any, Callable, Optional, Union
 from pathlib import Path
 
+from davia.admission import (
+    Admission,
+    AdmissionController,
+    AdmissionMiddleware,
+    admit,
+)
+from davia.cancellation import (
+    accepts_cancellation_token,
+    inject_cancellation_token,
+    with_deadline,
+)
+from davia.events import ChangeNotifier
+from davia.graphs import graph_docstring, scan_graphs
 from davia.routers import router
+from davia.jobs import JobWorker, get_broker
 from davia.main import run_server
+from davia.profiling import Profiler, Profiling, profiled
+from davia.reload import HotReloader
+from davia.servers import notify_ready
 from davia.scalar import get_scalar_api_reference
+from davia.retention import Retention, RetentionSweeper
+from davia.state import InMemoryStateBackend, StateBackend, inject_state
+from davia.sync import StateSyncRegistry
+from davia.websocket import TaskSocket
+
+logger = logging.getLogger(__name__)
 
 
 class Davia(FastAPI):
@@ -25,7 +55,14 @@ class Davia(FastAPI):
     ```
     """
 
-    def __init__(self, state=None, **kwargs):
+    def __init__(
+        self,
+        state: Optional[StateBackend] = None,
+        retention: Optional[Retention] = None,
+        admission: Optional[Admission] = None,
+        profiling: Optional[Profiling] = None,
+        **kwargs,
+    ):
         if "title" not in kwargs:
             kwargs["title"] = "Davia App"
         super().__init__(
@@ -34,6 +71,10 @@ class Davia(FastAPI):
             **kwargs,
         )
 
+        # Admission control for the whole app, inside CORS so rejections keep the CORS headers
+        if admission is not None:
+            self.add_middleware(AdmissionMiddleware, admission=admission)
+
         # Add CORS middleware
         self.add_middleware(
             CORSMiddleware,
@@ -43,10 +84,52 @@ class Davia(FastAPI):
             allow_headers=["*"],
         )
 
-        self._tasks = []
-        self._graphs = {}
+        self._tasks: list[str] = []
+        self._task_options: dict[
+            str, tuple[Callable, Optional[Admission], Optional[float]]
+        ] = {}
+        self._graphs: dict[str, dict[str, Any]] = {}
+        self._state_backend = state if state is not None else InMemoryStateBackend()
+        self._retention_sweeper = RetentionSweeper(retention) if retention else None
+        self._profiler = Profiler(profiling) if profiling else None
+        self._state_sync = StateSyncRegistry()
+        self._task_sockets: set[TaskSocket] = set()
+        self._job_broker = None
+        self._changes = ChangeNotifier()
+        # Namespace of the module creating the app, executed again by the hot reload
+        self._source_globals = _caller_globals(self, inspect.currentframe())
         self.include_router(router)
 
+        lifespan_context = self.router.lifespan_context
+
+        @asynccontextmanager
+        async def lifespan(app):
+            async with lifespan_context(app) as state:
+                background_tasks = []
+                if os.getenv("DAVIA_HOT_RELOAD") == "true":
+                    background_tasks.append(
+                        asyncio.create_task(HotReloader(self).run())
+                    )
+                # Jobs are only served with a broker
+                if os.getenv("DAVIA_BROKER_URL"):
+                    self._job_broker = get_broker(os.environ["DAVIA_BROKER_URL"])
+                    background_tasks.append(
+                        asyncio.create_task(JobWorker(self, self._job_broker).run())
+                    )
+                # The graph runtime notifies once its own startup is done
+                if "davia.runtime" not in sys.modules:
+                    notify_ready()
+                try:
+                    yield state
+                finally:
+                    for task in background_tasks:
+                        task.cancel()
+                    if self._job_broker is not None:
+                        await self._job_broker.close()
+                        self._job_broker = None
+
+        self.router.lifespan_context = lifespan
+
         # Add Scalar API reference route
         @self.get("/docs", include_in_schema=False)
         async def scalar_html():
@@ -55,17 +138,115 @@ class Davia(FastAPI):
                 title=self.title,
             )
 
-    def task(self, func: Callable) -> Callable:
+    def task(
+        self,
+        func: Optional[Callable] = None,
+        *,
+        admission: Optional[Admission] = None,
+        timeout: Optional[float] = None,
+    ) -> Callable:
+        """
+        Decorator to register a task, with an optional admission control and timeout.
+        Usage:
+            @app.task
+            def my_task(text: str) -> str:
+                return text
+
+            @app.task(admission=Admission(rate=10, max_concurrency=2), timeout=30)
+            def my_limited_task(text: str, token: CancellationToken) -> str:
+                token.raise_if_cancelled()
+                return text
+        """
+        if func is None:
+            return functools.partial(self.task, admission=admission, timeout=timeout)
+
+        self._register_task(func, admission, timeout)
+        return func
+
+    def _register_task(
+        self,
+        func: Callable,
+        admission: Optional[Admission] = None,
+        timeout: Optional[float] = None,
+    ):
         self._tasks.append(func.__name__)
+        self._task_options[func.__name__] = (func, admission, timeout)
+        self._add_task_route(self.router, func, admission, timeout)
+        # Tasks can also be registered once the app serves requests
+        self.openapi_schema = None
+        self._changes.bump()
+
+    def _add_task_route(
+        self,
+        router: APIRouter,
+        func: Callable,
+        admission: Optional[Admission],
+        timeout: Optional[float],
+    ):
+        endpoint = inject_state(inject_cancellation_token(func), self._state_backend)
+        if self._profiler is not None and self._profiler.selects("task", func.__name__):
+            endpoint = profiled(endpoint, func.__name__, self._profiler)
+        if admission is not None:
+            endpoint = admit(endpoint, AdmissionController(admission))
+        # Stop the task when its client disconnects or its deadline passes,
+        # async tasks are cancelled, sync ones have to check their token
+        cancellable = asyncio.iscoroutinefunction(func) or accepts_cancellation_token(
+            func
+        )
+        endpoint = with_deadline(endpoint, timeout, cancellable)
         # Add the route, letting FastAPI handle all the type inference
-        self.add_api_route(
+        router.add_api_route(
             f"/{func.__name__}",
-            func,
+            endpoint,
             methods=["POST"],
             tags=["Davia tasks"],
         )
 
-        return func
+    def _reload_from(self, other: "Davia") -> bool:
+        """
+        Replace the tasks and graphs with the ones of a freshly loaded app.
+
+        The task routes are built aside and swapped in at once, so the reload
+        can run in a thread while the event loop serves requests. Returns
+        whether the graphs or the schema changed.
+        """
+        task_paths = {f"/{name}" for name in self._tasks}
+        old_schema = self.openapi()
+
+        def is_task(route) -> bool:
+            return (
+                isinstance(route, APIRoute)
+                and route.path in task_paths
+                and "Davia tasks" in route.tags
+            )
+
+        # New task routes take the place of the old ones, before any catch-all route
+        index = next(
+            (i for i, route in enumerate(self.router.routes) if is_task(route)),
+            len(self.router.routes),
+        )
+        routes = [route for route in self.router.routes if not is_task(route)]
+        # The routes are added to a copy of the router, the live one keeps serving
+        task_router = copy.copy(self.router)
+        task_router.routes = []
+        for func, admission, timeout in other._task_options.values():
+            self._add_task_route(task_router, func, admission, timeout)
+        self.router.routes = routes[:index] + task_router.routes + routes[index:]
+        self._tasks = list(other._tasks)
+        self._task_options = dict(other._task_options)
+        graphs_changed = other._graphs.keys() != self._graphs.keys()
+        if graphs_changed:
+            logger.warning("Graphs added or removed are only served after a restart")
+        self._graphs = other._graphs
+        self.openapi_schema = None
+        return graphs_changed or self.openapi() != old_schema
+
+    async def push(self, event: str, data: Any):
+        """Push an event to the clients connected to `/davia/ws`."""
+        await asyncio.gather(
+            *(socket.push(event, data) for socket in list(self._task_sockets)),
+            return_exceptions=True,
+        )
 
     @property
     def graph(self):
@@ -90,6 +271,7 @@ class Davia(FastAPI):
             # Store graph with metadata
             self._graphs[func.__name__] = {
                 "source_file": source_file,  # Store the source file
+                "docstring": inspect.getdoc(func),
             }
 
             # Return the graph instance for direct access
@@ -97,6 +279,41 @@ class Davia(FastAPI):
 
         return decorator
 
+    def add_graph(self, name: str, source_file: Union[str, Path]):
+        """
+        Register the graph function of a file without importing it, the file is
+        only imported when the graph is first used.
+        Usage:
+            app.add_graph("my_graph", "agents/my_agent.py")
+        """
+        if not os.path.isfile(source_file):
+            raise FileNotFoundError(f"Graph file not found: {source_file}")
+        self._graphs[name] = {
+            "source_file": os.path.relpath(source_file),
+            "docstring": graph_docstring(name, source_file),
+        }
+
+    def add_graphs(self, directory: Union[str, Path], pattern: str = "*.py"):
+        """
+        Register the graph functions marked with `graph` in the files of a
+        directory and its subdirectories. Files are parsed, not imported, and
+        each one is only imported when one of its graphs is first used.
+        Usage:
+            app.add_graphs("agents")
+
+            # agents/my_agent.py
+            from davia import graph
+
+            @graph
+            def my_graph():
+                ...
+        """
+        # Files may import the app to decorate their graphs with it
+        app_names = [
+            name for name, value in self._source_globals.items() if value is self
+        ]
+        self._graphs.update(scan_graphs(directory, pattern, app_names))
+
     def run(
         self,
         host: str = "127.0.0.1",
@@ -104,6 +321,13 @@ class Davia(FastAPI):
         reload: bool = True,
         browser: bool = True,
         n_jobs_per_worker: int = 1,
+        max_jobs_per_worker: int = 10,
+        database_path: Optional[str] = None,
+        warmup: bool = False,
+        hot_reload: bool = False,
+        broker_url: Optional[str] = None,
+        server: str = "uvicorn",
+        zero_downtime: bool = False,
     ):
         """
         Run the Davia app.
@@ -113,7 +337,14 @@ class Davia(FastAPI):
             port: Port number to bind the development server to.
             reload: Enable auto-reload of the server when files change. Use only during development.
             browser: Open browser automatically when server starts.
-            n_jobs_per_worker: Number of jobs per worker.
+            n_jobs_per_worker: Number of jobs per worker, the minimum when it adapts to the load.
+            max_jobs_per_worker: Maximum number of jobs per worker. Above n_jobs_per_worker, the number of jobs adapts to the queued runs, the event loop lag and the CPU use.
+            database_path: Path to a SQLite database persisting the threads, runs and checkpoints of the graphs. Kept in memory when not set.
+            warmup: Build and compile the graphs at startup instead of on their first run.
+            broker_url: URL of a Redis-compatible server holding the job queues, shared by every process connected to it, or memory:// for queues local to the process. Jobs are disabled when not set.
+            hot_reload: Reload only the changed modules in the running server, keeping the state, the threads and the caches of the others. Replaces reload.
+            server: ASGI server running the app: uvicorn, or hypercorn to also serve HTTP/2.
+            zero_downtime: Keep the listening socket in a supervisor process. On SIGHUP a new server starts on the same socket and the previous one stops once its in-flight requests are done. Replaces reload.
 
         Example:
             ```python
@@ -125,4 +356,33 @@ class Davia(FastAPI):
         """
         frame_info = inspect.stack()[1]
         filename = Path(frame_info.filename)
-        run_server(filename, host, port, reload, browser, n_jobs_per_worker)
+        run_server(
+            filename,
+            host,
+            port,
+            reload,
+            browser,
+            n_jobs_per_worker,
+            max_jobs_per_worker,
+            database_path,
+            warmup,
+            hot_reload,
+            broker_url,
+            server,
+            zero_downtime,
+        )
+
+
+def _caller_globals(app: Davia, frame) -> dict:
+    """
+    Get the namespace of the code creating the app.
+
+    The constructors of the app, its own and the ones of subclasses, are
+    skipped, so a subclass or a factory gets the namespace of its module.
+    """
+    try:
+        while frame is not None and frame.f_locals.get("self") is app:
+            frame = frame.f_back
+        return frame.f_globals if frame is not None else {}
+    finally:
+        del frame
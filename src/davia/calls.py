@@ -0,0 +1,138 @@
+import asyncio
+import json
+from typing import Any, Awaitable, Callable, Optional
+from urllib.parse import urlencode
+
+from fastapi.routing import APIRoute
+
+from davia.cancellation import TIMEOUT_HEADER
+
+
+def find_task_route(app, task_name: Any) -> Optional[APIRoute]:
+    """Get the route of a task registered on the app."""
+    if task_name not in app._tasks:
+        return None
+    path = f"/{task_name}"
+    for route in app.router.routes:
+        if isinstance(route, APIRoute) and route.path == path:
+            return route
+    return None
+
+
+def base_scope(app) -> dict:
+    """ASGI scope of task calls made outside of any request."""
+    handlers = {
+        key: handler
+        for key, handler in app.exception_handlers.items()
+        if not isinstance(key, int)
+    }
+    status_handlers = {
+        key: handler
+        for key, handler in app.exception_handlers.items()
+        if isinstance(key, int)
+    }
+    return {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "scheme": "http",
+        "server": None,
+        "client": None,
+        "root_path": "",
+        "app": app,
+        "starlette.exception_handlers": (handlers, status_handlers),
+    }
+
+
+async def call_task(
+    route: APIRoute,
+    scope: dict,
+    args: dict,
+    headers: list[tuple[bytes, bytes]],
+    cancelled: asyncio.Event,
+    timeout: Optional[float] = None,
+    on_partial: Optional[Callable[[str], Awaitable[None]]] = None,
+) -> tuple[int, str]:
+    """
+    Call a task through its route handler, without the middlewares and the routing.
+
+    Arguments are mapped to the query and body parameters of the route, so the
+    call is validated, admitted and serialized as over HTTP. Setting `cancelled`
+    is seen by the task as a client disconnection. Streamed responses are
+    passed chunk by chunk to `on_partial`.
+
+    Returns the status code and the JSON result.
+    """
+    dependant = route.dependant
+    query = {
+        param.alias: args[param.name]
+        for param in dependant.query_params
+        if args.get(param.name) is not None
+    }
+    body = None
+    if route.body_field is not None:
+        if any(param.name == route.body_field.name for param in dependant.body_params):
+            # A single body parameter is the whole body
+            body = args.get(route.body_field.name)
+        else:
+            body = {
+                param.alias: args[param.name]
+                for param in dependant.body_params
+                if param.name in args
+            }
+    headers = [*headers, (b"content-type", b"application/json")]
+    if timeout is not None:
+        headers.append((TIMEOUT_HEADER.lower().encode(), str(timeout).encode()))
+
+    scope = {
+        **scope,
+        "type": "http",
+        "method": "POST",
+        "path": route.path,
+        "raw_path": route.path.encode(),
+        "query_string": urlencode(query, doseq=True).encode(),
+        "headers": headers,
+        "path_params": {},
+        "route": route,
+    }
+    request_body = json.dumps(body).encode() if body is not None else b""
+    received = False
+
+    async def receive():
+        nonlocal received
+        if not received:
+            received = True
+            return {"type": "http.request", "body": request_body, "more_body": False}
+        await cancelled.wait()
+        return {"type": "http.disconnect"}
+
+    status = 500
+    is_json = False
+    chunks: list[bytes] = []
+    streamed = False
+
+    async def send(message):
+        nonlocal status, is_json, streamed
+        if message["type"] == "http.response.start":
+            status = message["status"]
+            is_json = any(
+                name.lower() == b"content-type" and b"json" in value
+                for name, value in message.get("headers", [])
+            )
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+            if message.get("more_body") or streamed:
+                # Streamed responses are relayed chunk by chunk
+                streamed = True
+                partial = b"".join(chunks).decode()
+                chunks.clear()
+                if partial and on_partial is not None:
+                    await on_partial(partial)
+
+    await route.app(scope, receive, send)
+    body = b"".join(chunks)
+    if streamed or not body:
+        return status, "null"
+    if is_json:
+        return status, body.decode()
+    return status, json.dumps(body.decode())
@@ -0,0 +1,232 @@
+import asyncio
+import contextvars
+import functools
+import inspect
+import threading
+import time
+from typing import Callable, Optional
+
+from fastapi import HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+
+from davia.utils import set_signature, typed_signature
+
+# Header with the seconds left before the client gives up on the request
+TIMEOUT_HEADER = "X-Davia-Timeout"
+# Parameter added to the task routes to get the request
+_REQUEST_PARAM = "davia_cancellation_request"
+
+_current_token: contextvars.ContextVar["CancellationToken"] = contextvars.ContextVar(
+    "davia_cancellation_token"
+)
+
+
+class TaskCancelled(Exception):
+    """The task was cancelled because its client disconnected or its deadline passed."""
+
+
+class CancellationToken:
+    """
+    Cooperative cancellation of a task.
+
+    Declare a parameter annotated with `CancellationToken` to get the token of
+    the request. Async tasks are cancelled for you, sync tasks should check the
+    token to stop early.
+
+    ## Example
+
+    ```python
+    from davia import CancellationToken
+
+    @app.task(timeout=30)
+    def crunch(items: list[str], token: CancellationToken) -> int:
+        for item in items:
+            token.raise_if_cancelled()
+            process(item)
+        return len(items)
+    ```
+    """
+
+    def __init__(self, deadline: Optional[float] = None):
+        self.deadline = deadline
+        self._event = threading.Event()
+
+    @property
+    def cancelled(self) -> bool:
+        if not self._event.is_set() and self.remaining() == 0:
+            self._event.set()
+        return self._event.is_set()
+
+    def cancel(self):
+        self._event.set()
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left before the deadline, None without a deadline."""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def raise_if_cancelled(self):
+        if self.cancelled:
+            raise TaskCancelled()
+
+
+def _token_params(func: Callable) -> list[str]:
+    return [
+        name
+        for name, param in typed_signature(func).parameters.items()
+        if param.annotation is CancellationToken
+    ]
+
+
+def accepts_cancellation_token(func: Callable) -> bool:
+    """Whether a task declares a `CancellationToken` parameter."""
+    return bool(_token_params(func))
+
+
+def inject_cancellation_token(func: Callable) -> Callable:
+    """Wrap a task to pass the token of the request to its `CancellationToken` parameters."""
+    signature = typed_signature(func)
+    token_params = _token_params(func)
+    if not token_params:
+        return func
+
+    def with_token(kwargs: dict) -> dict:
+        token = _current_token.get(None) or CancellationToken()
+        return {**kwargs, **{name: token for name in token_params}}
+
+    if asyncio.iscoroutinefunction(func):
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            return await func(*args, **with_token(kwargs))
+    else:
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return func(*args, **with_token(kwargs))
+
+    set_signature(
+        wrapper,
+        signature.replace(
+            parameters=[
+                param
+                for name, param in signature.parameters.items()
+                if name not in token_params
+            ]
+        ),
+    )
+    return wrapper
+
+
+def _get_timeout(request: Request, timeout: Optional[float]) -> Optional[float]:
+    header = request.headers.get(TIMEOUT_HEADER)
+    if header is None:
+        return timeout
+    try:
+        client_timeout = float(header)
+    except ValueError:
+        raise HTTPException(400, f"Invalid {TIMEOUT_HEADER} header")
+    return client_timeout if timeout is None else min(timeout, client_timeout)
+
+
+async def _wait_for_disconnect(request: Request):
+    while (await request.receive())["type"] != "http.disconnect":
+        pass
+
+
+def _discard_result(task: asyncio.Task):
+    # Abandoned sync endpoints finish in their thread, usually with TaskCancelled
+    if not task.cancelled():
+        task.exception()
+
+
+def with_deadline(
+    endpoint: Callable, timeout: Optional[float] = None, cancellable: bool = False
+) -> Callable:
+    """
+    Wrap a task route endpoint to stop it when its client disconnects or its deadline passes.
+
+    The deadline is the earliest of `timeout` and of the `X-Davia-Timeout`
+    header. Async endpoints are cancelled, sync endpoints keep their thread
+    until they check their cancellation token.
+
+    Requests are only watched when they have a deadline or the task is
+    `cancellable`, being async or taking a cancellation token. Requests to
+    the other tasks, which could not be stopped, call the endpoint directly,
+    without a disconnection watcher.
+    """
+    signature = typed_signature(endpoint)
+    is_coroutine = asyncio.iscoroutinefunction(endpoint)
+    # FastAPI only passes the request to one parameter, shared with the endpoint
+    request_param = next(
+        (
+            name
+            for name, param in signature.parameters.items()
+            if param.annotation is Request
+        ),
+        None,
+    )
+
+    @functools.wraps(endpoint)
+    async def wrapper(*args, **kwargs):
+        if request_param is None:
+            request: Request = kwargs.pop(_REQUEST_PARAM)
+        else:
+            request = kwargs[request_param]
+        request_timeout = _get_timeout(request, timeout)
+        if request_timeout is None and not cancellable:
+            if is_coroutine:
+                return await endpoint(*args, **kwargs)
+            return await run_in_threadpool(endpoint, *args, **kwargs)
+
+        token = CancellationToken(
+            time.monotonic() + request_timeout if request_timeout is not None else None
+        )
+        context_token = _current_token.set(token)
+        try:
+            if is_coroutine:
+                work = asyncio.ensure_future(endpoint(*args, **kwargs))
+            else:
+                work = asyncio.ensure_future(
+                    run_in_threadpool(endpoint, *args, **kwargs)
+                )
+        finally:
+            _current_token.reset(context_token)
+        disconnect = asyncio.ensure_future(_wait_for_disconnect(request))
+        disconnect.add_done_callback(_discard_result)
+
+        try:
+            await asyncio.wait(
+                {work, disconnect},
+                timeout=request_timeout,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+        except asyncio.CancelledError:
+            token.cancel()
+            work.cancel()
+            raise
+        finally:
+            disconnect.cancel()
+
+        if work.done():
+            return work.result()
+        token.cancel()
+        work.cancel()
+        work.add_done_callback(_discard_result)
+        if disconnect.done() and not disconnect.cancelled():
+            # Never read by the client, only logged, with the status nginx uses
+            raise HTTPException(499, "Client disconnected")
+        raise HTTPException(504, "Task deadline exceeded")
+
+    if request_param is None:
+        signature = signature.replace(
+            parameters=[
+                *signature.parameters.values(),
+                inspect.Parameter(
+                    _REQUEST_PARAM, inspect.Parameter.KEYWORD_ONLY, annotation=Request
+                ),
+            ]
+        )
+    set_signature(wrapper, signature)
+    return wrapper
@@ -2,6 +2,7 @@ import typer
 from rich import print
 from typing_extensions import Annotated
 from pathlib import Path
+from typing import Optional
 from davia.main import run_server
 
 app = typer.Typer(no_args_is_help=True, rich_markup_mode="markdown")
@@ -53,8 +54,52 @@ def run(
     ] = True,
     n_jobs_per_worker: Annotated[
         int,
-        typer.Option(help="Number of jobs per worker."),
+        typer.Option(
+            help="Number of jobs per worker, the minimum when it adapts to the load."
+        ),
     ] = 1,
+    max_jobs_per_worker: Annotated[
+        int,
+        typer.Option(
+            help="Maximum number of jobs per worker. Above --n-jobs-per-worker, the number of jobs adapts to the queued runs, the event loop lag and the CPU use."
+        ),
+    ] = 10,
+    database_path: Annotated[
+        Optional[str],
+        typer.Option(
+            help="Path to a SQLite database persisting the threads, runs and checkpoints of the graphs. Kept in memory when not set."
+        ),
+    ] = None,
+    warmup: Annotated[
+        bool,
+        typer.Option(
+            help="Build and compile the graphs at startup instead of on their first run."
+        ),
+    ] = False,
+    hot_reload: Annotated[
+        bool,
+        typer.Option(
+            help="Reload only the changed modules in the running server, keeping the state, the threads and the caches of the others. Replaces --reload."
+        ),
+    ] = False,
+    broker_url: Annotated[
+        Optional[str],
+        typer.Option(
+            help="URL of a Redis-compatible server holding the job queues, shared by every process connected to it, or memory:// for queues local to the process. Jobs are disabled when not set."
+        ),
+    ] = None,
+    server: Annotated[
+        str,
+        typer.Option(
+            help="ASGI server running the app: uvicorn, or hypercorn to also serve HTTP/2."
+        ),
+    ] = "uvicorn",
+    zero_downtime: Annotated[
+        bool,
+        typer.Option(
+            help="Keep the listening socket in a supervisor process. On SIGHUP a new server starts on the same socket and the previous one stops once its in-flight requests are done. Replaces --reload."
+        ),
+    ] = False,
 ):
     """
     Run a Davia app from a Python file.
@@ -70,6 +115,13 @@ def run(
             reload=reload,
             browser=browser,
             n_jobs_per_worker=n_jobs_per_worker,
+            max_jobs_per_worker=max_jobs_per_worker,
+            database_path=database_path,
+            warmup=warmup,
+            hot_reload=hot_reload,
+            broker_url=broker_url,
+            server=server,
+            zero_downtime=zero_downtime,
         )
     except Exception as e:
         print(f"[red]Error: {str(e)}[/red]")
@@ -0,0 +1,71 @@
+import asyncio
+import json
+import time
+from typing import AsyncIterator, Optional
+
+# Seconds between the comments keeping idle event streams open through proxies
+KEEPALIVE_INTERVAL = 15.0
+
+
+class ChangeNotifier:
+    """
+    Version of the tasks, graphs and schemas of an app, bumped when they change.
+
+    The version starts from the boot time in milliseconds, so it also changes
+    when the server restarts. Bumps made before a client reads them are
+    coalesced into a single event. Bumps can come from other threads, like
+    the tasks registered by a hot reload, and are handed over to the loop of
+    the waiters.
+    """
+
+    def __init__(self):
+        self.version = int(time.time() * 1000)
+        self._waiters: list[asyncio.Future] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def bump(self):
+        loop = self._loop
+        if loop is not None and loop.is_running() and not _running(loop):
+            loop.call_soon_threadsafe(self.bump)
+            return
+        self.version += 1
+        for waiter in self._waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+        self._waiters.clear()
+
+    async def wait(self, version: Optional[int], timeout: float) -> int:
+        """Wait at most `timeout` seconds for a version other than `version`."""
+        if self.version == version:
+            self._loop = asyncio.get_running_loop()
+            waiter = self._loop.create_future()
+            self._waiters.append(waiter)
+            try:
+                await asyncio.wait_for(waiter, timeout)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+        return self.version
+
+    async def stream(self, last_version: Optional[int] = None) -> AsyncIterator[str]:
+        """
+        Server-sent events of the version, starting with the current one
+        unless the client already has it.
+        """
+        version = last_version
+        while True:
+            latest = await self.wait(version, KEEPALIVE_INTERVAL)
+            if latest == version:
+                yield ": keepalive\n\n"
+                continue
+            version = latest
+            yield f"id: {version}\nevent: changed\ndata: {json.dumps({'version': version})}\n\n"
+
+
+def _running(loop: asyncio.AbstractEventLoop) -> bool:
+    try:
+        return asyncio.get_running_loop() is loop
+    except RuntimeError:
+        return False
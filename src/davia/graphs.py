@@ -0,0 +1,210 @@
+import ast
+import asyncio
+import inspect
+import os
+import threading
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, Callable, Iterable, Optional, Union
+
+from davia.routers import get_function_from_path
+
+
+class GraphRegistry:
+    """
+    Process-wide cache of the compiled graphs registered on the Davia app.
+
+    Each graph is built and compiled once, and again only when its source file
+    changes. Graph functions taking parameters depend on the run config, and
+    async ones return a coroutine, so they are returned as is and built by the
+    runtime on each run.
+    """
+
+    def __init__(self):
+        self._graphs: dict[str, tuple[Callable, Any]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str, source_file: str) -> Any:
+        """Get the compiled graph, or the graph function if it takes parameters."""
+        # Modules are only executed again when their source file changed
+        func = get_function_from_path(f"{source_file}:{name}")
+        with self._lock:
+            cached = self._graphs.get(name)
+            if cached is not None and cached[0] is func:
+                return cached[1]
+
+            if inspect.signature(func).parameters or inspect.iscoroutinefunction(func):
+                graph = func
+            else:
+                graph = func()
+                if not hasattr(graph, "invoke") and hasattr(graph, "compile"):
+                    graph = graph.compile()
+            self._graphs[name] = (func, graph)
+            return graph
+
+    def factory(self, name: str, source_file: str) -> Callable:
+        """
+        Get a graph factory for the runtime, serving the cached compiled graph.
+
+        The source file is only imported on the first run of the graph, in a
+        worker thread so the event loop keeps serving. The factory always takes
+        the run config, passed on to the graph functions taking parameters, and
+        enters the context managers they return.
+        """
+
+        @asynccontextmanager
+        async def graph_factory(config: dict):
+            graph = await asyncio.to_thread(self.get, name, source_file)
+            if not inspect.isfunction(graph):
+                yield graph
+                return
+            value = graph(config) if inspect.signature(graph).parameters else graph()
+            if hasattr(value, "__aenter__"):
+                async with value as entered:
+                    yield entered
+            elif hasattr(value, "__enter__"):
+                with value as entered:
+                    yield entered
+            elif inspect.isawaitable(value):
+                yield await value
+            else:
+                yield value
+
+        return graph_factory
+
+    def warm_up(self, graphs: dict[str, dict]):
+        """Build and compile the graphs ahead of their first run."""
+        for name, graph_data in graphs.items():
+            self.get(name, graph_data["source_file"])
+
+
+registry = GraphRegistry()
+
+
+def graph(func: Callable) -> Callable:
+    """
+    Mark a graph function to be found by `Davia.add_graphs`.
+
+    Modules marking their graphs this way are only imported when a graph is
+    first used, instead of by the app file.
+
+    ## Example
+
+    ```python
+    from davia import graph
+
+    @graph
+    def my_graph():
+        graph = StateGraph(State)
+        ...
+        return graph
+    ```
+    """
+    return func
+
+
+def _davia_names(tree: ast.Module) -> tuple[set[str], set[str]]:
+    """Get the names bound to the Davia module or an app, and to its `graph` decorator."""
+    objects: set[str] = set()
+    decorators: set[str] = set()
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            objects.update(
+                alias.asname or alias.name
+                for alias in node.names
+                if alias.name == "davia"
+            )
+        elif isinstance(node, ast.ImportFrom) and node.module == "davia":
+            decorators.update(
+                alias.asname or alias.name
+                for alias in node.names
+                if alias.name == "graph"
+            )
+        elif (
+            isinstance(node, ast.Assign)
+            and isinstance(node.value, ast.Call)
+            and _is_davia_class(node.value.func)
+        ):
+            objects.update(
+                target.id for target in node.targets if isinstance(target, ast.Name)
+            )
+    return objects, decorators
+
+
+def _is_davia_class(node: ast.expr) -> bool:
+    # Davia(...) and davia.Davia(...)
+    if isinstance(node, ast.Name):
+        return node.id == "Davia"
+    return isinstance(node, ast.Attribute) and node.attr == "Davia"
+
+
+def _is_graph_decorator(
+    node: ast.expr, objects: set[str], decorators: set[str]
+) -> bool:
+    # @graph imported from davia, @davia.graph and @app.graph
+    if isinstance(node, ast.Name):
+        return node.id in decorators
+    return (
+        isinstance(node, ast.Attribute)
+        and node.attr == "graph"
+        and isinstance(node.value, ast.Name)
+        and node.value.id in objects
+    )
+
+
+def scan_graphs(
+    directory: Union[str, Path],
+    pattern: str = "*.py",
+    app_names: Iterable[str] = (),
+) -> dict[str, dict[str, Any]]:
+    """
+    Find the graph functions of the Python files of a directory, without importing them.
+
+    Files are parsed for the top-level functions, async or not, decorated with
+    the `graph` function of davia or the `graph` method of a Davia app, in
+    sorted order, skipping hidden directories and `__pycache__`. `app_names`
+    are the names the files import the app under, apps created in the files
+    are found by themselves.
+
+    Returns the source file and docstring of each graph, by graph name.
+    """
+    graphs: dict[str, dict[str, Any]] = {}
+    for path in sorted(Path(directory).rglob(pattern)):
+        relative_parts = path.relative_to(directory).parts[:-1]
+        if any(
+            part.startswith(".") or part == "__pycache__" for part in relative_parts
+        ):
+            continue
+        tree = ast.parse(path.read_bytes(), filename=str(path))
+        objects, decorators = _davia_names(tree)
+        objects.update(app_names)
+        for node in tree.body:
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and any(
+                _is_graph_decorator(decorator, objects, decorators)
+                for decorator in node.decorator_list
+            ):
+                source_file = os.path.relpath(path)
+                if (
+                    node.name in graphs
+                    and graphs[node.name]["source_file"] != source_file
+                ):
+                    raise ValueError(
+                        f"Graph '{node.name}' is defined in both {graphs[node.name]['source_file']} and {source_file}"
+                    )
+                graphs[node.name] = {
+                    "source_file": source_file,
+                    "docstring": ast.get_docstring(node),
+                }
+    return graphs
+
+
+def graph_docstring(name: str, source_file: Union[str, Path]) -> Optional[str]:
+    """Get the docstring of a top-level function of a file, without importing it."""
+    tree = ast.parse(Path(source_file).read_bytes(), filename=str(source_file))
+    for node in tree.body:
+        if (
+            isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef))
+            and node.name == name
+        ):
+            return ast.get_docstring(node)
+    return None
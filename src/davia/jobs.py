@@ -0,0 +1,468 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Any, Optional
+
+import httpx
+
+from davia.calls import base_scope, call_task, find_task_route
+
+logger = logging.getLogger(__name__)
+
+# Jobs run at the same time by each process
+JOB_CONCURRENCY = 16
+# Seconds the status and result of a job are kept
+JOB_TTL = 3600
+# Seconds after which a job taken by a process that died is taken again
+JOB_VISIBILITY_TIMEOUT = 300
+# Seconds between two checks for jobs to take again
+JOB_RECLAIM_INTERVAL = 30
+# Seconds a worker blocks waiting for jobs before checking for new queues
+_DEQUEUE_TIMEOUT = 1.0
+
+
+class JobBroker(ABC):
+    """
+    Base class of the brokers holding the job queues and their results.
+
+    There is one queue per task, plus one per graph, and workers take one job
+    from each non-empty queue in turn so a busy task does not starve the others.
+    A job taken is taken again after `visibility_timeout` seconds, unless
+    acknowledged or kept with `extend` in the meantime.
+    """
+
+    visibility_timeout: float = JOB_VISIBILITY_TIMEOUT
+
+    @abstractmethod
+    async def enqueue(self, queue: str, job: dict): ...
+
+    @abstractmethod
+    async def dequeue(
+        self, queues: list[str], consumer: str, timeout: float
+    ) -> list[tuple[str, str, dict]]:
+        """Take at most one job from each queue, as (queue, entry id, job) tuples."""
+
+    @abstractmethod
+    async def extend(self, queue: str, entry_id: str, consumer: str):
+        """Keep a job taken for another `visibility_timeout` seconds, while it runs."""
+
+    @abstractmethod
+    async def ack(self, queue: str, entry_id: str): ...
+
+    @abstractmethod
+    async def set_status(self, job_id: str, status: dict): ...
+
+    @abstractmethod
+    async def get_status(self, job_id: str) -> Optional[dict]: ...
+
+    @abstractmethod
+    async def publish(self, job_id: str, message: dict):
+        """Send a message to the subscribers of a job, in every process."""
+
+    @abstractmethod
+    async def subscribe(self, job_id: str) -> "Subscription":
+        """Subscribe to the messages of a job, sent from then on."""
+
+    async def close(self):
+        pass
+
+
+class Subscription(ABC):
+    @abstractmethod
+    async def get(self) -> dict:
+        """Wait for the next message."""
+
+    @abstractmethod
+    async def close(self): ...
+
+
+class _QueueSubscription(Subscription):
+    def __init__(self, subscribers: dict[str, set[asyncio.Queue]], job_id: str):
+        self.subscribers = subscribers
+        self.job_id = job_id
+        self.queue: asyncio.Queue = asyncio.Queue()
+        subscribers.setdefault(job_id, set()).add(self.queue)
+
+    async def get(self) -> dict:
+        return await self.queue.get()
+
+    async def close(self):
+        queues = self.subscribers.get(self.job_id, set())
+        queues.discard(self.queue)
+        if not queues:
+            self.subscribers.pop(self.job_id, None)
+
+
+class _PubSubSubscription(Subscription):
+    def __init__(self, pubsub):
+        self.pubsub = pubsub
+
+    async def get(self) -> dict:
+        while True:
+            message = await self.pubsub.get_message(
+                ignore_subscribe_messages=True, timeout=None
+            )
+            if message is not None and message["type"] == "message":
+                return json.loads(message["data"])
+
+    async def close(self):
+        await self.pubsub.aclose()
+
+
+class InMemoryBroker(JobBroker):
+    """
+    Broker local to the process, an in-process fake of Redis.
+
+    Like the Redis broker, a job taken is pending until acknowledged, and taken
+    again once it has been pending for `visibility_timeout` seconds.
+    """
+
+    def __init__(self, visibility_timeout: float = JOB_VISIBILITY_TIMEOUT):
+        self.visibility_timeout = visibility_timeout
+        self._queues: dict[str, deque[tuple[str, dict]]] = {}
+        # Jobs taken and not acknowledged yet, with the time they were taken
+        self._pending: dict[tuple[str, str], tuple[float, dict]] = {}
+        self._statuses: dict[str, tuple[float, dict]] = {}
+        self._subscribers: dict[str, set[asyncio.Queue]] = {}
+        self._available = asyncio.Event()
+
+    async def enqueue(self, queue: str, job: dict):
+        self._queues.setdefault(queue, deque()).append((uuid.uuid4().hex, job))
+        self._available.set()
+
+    async def dequeue(
+        self, queues: list[str], consumer: str, timeout: float
+    ) -> list[tuple[str, str, dict]]:
+        deadline = time.monotonic() + timeout
+        while True:
+            self._reclaim()
+            jobs = [
+                (queue, *self._queues[queue].popleft())
+                for queue in queues
+                if self._queues.get(queue)
+            ]
+            now = time.monotonic()
+            for queue, entry_id, job in jobs:
+                self._pending[(queue, entry_id)] = (now, job)
+            if jobs or now >= deadline:
+                return jobs
+            self._available.clear()
+            try:
+                await asyncio.wait_for(
+                    self._available.wait(), deadline - time.monotonic()
+                )
+            except asyncio.TimeoutError:
+                pass
+
+    def _reclaim(self):
+        """Put back the jobs pending for longer than the visibility timeout."""
+        limit = time.monotonic() - self.visibility_timeout
+        for (queue, entry_id), (taken_at, job) in list(self._pending.items()):
+            if taken_at <= limit:
+                del self._pending[(queue, entry_id)]
+                self._queues.setdefault(queue, deque()).appendleft((entry_id, job))
+
+    async def extend(self, queue: str, entry_id: str, consumer: str):
+        pending = self._pending.get((queue, entry_id))
+        if pending is not None:
+            self._pending[(queue, entry_id)] = (time.monotonic(), pending[1])
+
+    async def ack(self, queue: str, entry_id: str):
+        self._pending.pop((queue, entry_id), None)
+
+    async def set_status(self, job_id: str, status: dict):
+        now = time.monotonic()
+        self._statuses[job_id] = (now + JOB_TTL, status)
+        for expired in [
+            key for key, (expires_at, _) in self._statuses.items() if expires_at < now
+        ]:
+            del self._statuses[expired]
+
+    async def get_status(self, job_id: str) -> Optional[dict]:
+        entry = self._statuses.get(job_id)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        return entry[1]
+
+    async def publish(self, job_id: str, message: dict):
+        for subscriber in self._subscribers.get(job_id, ()):
+            subscriber.put_nowait(message)
+
+    async def subscribe(self, job_id: str) -> Subscription:
+        return _QueueSubscription(self._subscribers, job_id)
+
+
+class RedisBroker(JobBroker):
+    """
+    Broker shared by every process connected to a Redis-compatible server.
+
+    Queues are streams read through a consumer group, so each job is taken by
+    one process and taken again if that process dies before acknowledging it.
+    Jobs left pending are looked for every `JOB_RECLAIM_INTERVAL` seconds, not
+    on every read. Statuses are keys expiring after `JOB_TTL` and messages use
+    pub/sub.
+    """
+
+    GROUP = "davia"
+
+    def __init__(
+        self,
+        url: str,
+        prefix: str = "davia",
+        visibility_timeout: float = JOB_VISIBILITY_TIMEOUT,
+    ):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise ImportError(
+                'A Redis broker requires the redis extra: pip install -U "davia[redis]"'
+            ) from None
+        self.redis = redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+        self.visibility_timeout = visibility_timeout
+        self._groups: set[str] = set()
+        self._reclaimed_at = 0.0
+
+    def _stream(self, queue: str) -> str:
+        return f"{self.prefix}:queue:{queue}"
+
+    async def _ensure_group(self, stream: str):
+        if stream in self._groups:
+            return
+        try:
+            await self.redis.xgroup_create(stream, self.GROUP, id="0", mkstream=True)
+        except Exception as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        self._groups.add(stream)
+
+    async def enqueue(self, queue: str, job: dict):
+        stream = self._stream(queue)
+        await self._ensure_group(stream)
+        await self.redis.xadd(stream, {"job": json.dumps(job)})
+
+    async def dequeue(
+        self, queues: list[str], consumer: str, timeout: float
+    ) -> list[tuple[str, str, dict]]:
+        if not queues:
+            await asyncio.sleep(timeout)
+            return []
+        streams = {self._stream(queue): queue for queue in queues}
+        for stream in streams:
+            await self._ensure_group(stream)
+        if time.monotonic() - self._reclaimed_at >= JOB_RECLAIM_INTERVAL:
+            self._reclaimed_at = time.monotonic()
+            jobs = await self._reclaim(streams, consumer)
+            if jobs:
+                return jobs
+
+        # One job from each stream in a single call
+        response = await self.redis.xreadgroup(
+            self.GROUP,
+            consumer,
+            {stream: ">" for stream in streams},
+            count=1,
+            block=int(timeout * 1000),
+        )
+        return [
+            (streams[stream], entry_id, json.loads(fields["job"]))
+            for stream, entries in response or []
+            for entry_id, fields in entries
+        ]
+
+    async def _reclaim(
+        self, streams: dict[str, str], consumer: str
+    ) -> list[tuple[str, str, dict]]:
+        """Take back a job left by a process that died, from each stream."""
+        jobs: list[tuple[str, str, dict]] = []
+        for stream in streams:
+            _, claimed, *_ = await self.redis.xautoclaim(
+                stream,
+                self.GROUP,
+                consumer,
+                min_idle_time=int(self.visibility_timeout * 1000),
+                count=1,
+            )
+            jobs.extend(
+                (streams[stream], entry_id, json.loads(fields["job"]))
+                for entry_id, fields in claimed
+                if fields
+            )
+        return jobs
+
+    async def extend(self, queue: str, entry_id: str, consumer: str):
+        # Claiming the entry again resets its idle time
+        await self.redis.xclaim(
+            self._stream(queue),
+            self.GROUP,
+            consumer,
+            min_idle_time=0,
+            message_ids=[entry_id],
+            justid=True,
+        )
+
+    async def ack(self, queue: str, entry_id: str):
+        stream = self._stream(queue)
+        await self.redis.xack(stream, self.GROUP, entry_id)
+        await self.redis.xdel(stream, entry_id)
+
+    async def set_status(self, job_id: str, status: dict):
+        await self.redis.set(
+            f"{self.prefix}:job:{job_id}", json.dumps(status), ex=JOB_TTL
+        )
+
+    async def get_status(self, job_id: str) -> Optional[dict]:
+        value = await self.redis.get(f"{self.prefix}:job:{job_id}")
+        return json.loads(value) if value is not None else None
+
+    async def publish(self, job_id: str, message: dict):
+        await self.redis.publish(f"{self.prefix}:job:{job_id}", json.dumps(message))
+
+    async def subscribe(self, job_id: str) -> Subscription:
+        pubsub = self.redis.pubsub()
+        await pubsub.subscribe(f"{self.prefix}:job:{job_id}")
+        return _PubSubSubscription(pubsub)
+
+    async def close(self):
+        await self.redis.aclose()
+
+
+def get_broker(url: Optional[str] = None) -> JobBroker:
+    """Get the broker of a `redis://`, `rediss://`, `unix://` or `memory://` URL."""
+    if not url or url.startswith("memory://"):
+        return InMemoryBroker()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBroker(url)
+    raise ValueError(f"Unsupported broker URL: {url}")
+
+
+def graph_queue(graph_id: str) -> str:
+    return f"graph:{graph_id}"
+
+
+def task_queue(task_name: str) -> str:
+    return f"task:{task_name}"
+
+
+class JobWorker:
+    """Runs the jobs of the tasks and graphs of an app, taken from the shared queues."""
+
+    def __init__(self, app, broker: JobBroker, concurrency: int = JOB_CONCURRENCY):
+        self.app = app
+        self.broker = broker
+        self.consumer = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._slots = asyncio.Semaphore(concurrency)
+        self._jobs: set[asyncio.Task] = set()
+
+    def _queues(self) -> list[str]:
+        graphs = json.loads(os.getenv("DAVIA_GRAPHS") or "{}")
+        return [task_queue(name) for name in self.app._tasks] + [
+            graph_queue(graph_id) for graph_id in graphs
+        ]
+
+    async def run(self):
+        try:
+            while True:
+                # Jobs are only taken when they can start
+                await self._slots.acquire()
+                self._slots.release()
+                try:
+                    entries = await self.broker.dequeue(
+                        self._queues(), self.consumer, _DEQUEUE_TIMEOUT
+                    )
+                except Exception:
+                    logger.exception("Failed to take jobs from the broker")
+                    await asyncio.sleep(_DEQUEUE_TIMEOUT)
+                    continue
+                for queue, entry_id, job in entries:
+                    await self._slots.acquire()
+                    task = asyncio.create_task(self._run_job(queue, entry_id, job))
+                    self._jobs.add(task)
+                    task.add_done_callback(self._jobs.discard)
+        finally:
+            for task in self._jobs:
+                task.cancel()
+
+    async def _keep(self, queue: str, entry_id: str):
+        """Extend the visibility of a running job, so it is not taken again."""
+        while True:
+            await asyncio.sleep(self.broker.visibility_timeout / 3)
+            try:
+                await self.broker.extend(queue, entry_id, self.consumer)
+            except Exception:
+                logger.exception("Failed to extend the visibility of a job")
+
+    async def _run_job(self, queue: str, entry_id: str, job: dict):
+        job_id = job["job_id"]
+        heartbeat = asyncio.ensure_future(self._keep(queue, entry_id))
+        try:
+            await self.broker.set_status(
+                job_id, {"job_id": job_id, "status": "running"}
+            )
+            if job["kind"] == "graph":
+                status_code, result = await self._run_graph(job)
+            else:
+                status_code, result = await self._run_task(job)
+            status = {
+                "job_id": job_id,
+                "status": "done",
+                "status_code": status_code,
+                "result": result,
+            }
+        except Exception:
+            logger.exception("Job %s failed", job_id)
+            status = {
+                "job_id": job_id,
+                "status": "done",
+                "status_code": 500,
+                "result": {"detail": "Internal Server Error"},
+            }
+        finally:
+            heartbeat.cancel()
+        try:
+            await self.broker.set_status(job_id, status)
+            await self.broker.publish(job_id, {"event": "result", "data": status})
+            await self.broker.ack(queue, entry_id)
+        finally:
+            self._slots.release()
+
+    async def _run_task(self, job: dict) -> tuple[int, Any]:
+        route = find_task_route(self.app, job["task"])
+        if route is None:
+            return 404, {"detail": f"Task '{job['task']}' not found"}
+
+        async def on_partial(partial: str):
+            await self.broker.publish(
+                job["job_id"], {"event": "partial", "data": partial}
+            )
+
+        status_code, result = await call_task(
+            route,
+            base_scope(self.app),
+            job.get("args") or {},
+            [
+                (name.lower().encode(), value.encode())
+                for name, value in job.get("headers", {}).items()
+            ],
+            asyncio.Event(),
+            timeout=job.get("timeout"),
+            on_partial=on_partial,
+        )
+        return status_code, json.loads(result)
+
+    async def _run_graph(self, job: dict) -> tuple[int, Any]:
+        # Stateless runs only need the graph, so any process can run them
+        transport = httpx.ASGITransport(app=self.app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://davia", timeout=None
+        ) as client:
+            response = await client.post(
+                "/runs/wait", json={**job["payload"], "assistant_id": job["graph"]}
+            )
+        return response.status_code, response.json()
@@ -1,6 +1,5 @@
 from dotenv import load_dotenv
 import json
-import uvicorn
 from rich import print
 from rich.text import Text
 import typer
@@ -8,8 +7,11 @@ import threading
 from pathlib import Path
 import importlib
 from fastapi_cli.discover import get_import_data
+import os
 import sys
+from typing import Optional
 
+from davia.servers import serve
 from davia.utils import setup_logging
 
 # Configure logging
@@ -34,7 +36,15 @@ def run_server(
     reload: bool = True,
     browser: bool = True,
     n_jobs_per_worker: int = 1,
+    max_jobs_per_worker: int = 10,
+    database_path: Optional[str] = None,
+    warmup: bool = False,
+    hot_reload: bool = False,
+    broker_url: Optional[str] = None,
+    server: str = "uvicorn",
+    zero_downtime: bool = False,
 ):
+    n_jobs_per_worker = n_jobs_per_worker if n_jobs_per_worker else 1
     local_url = f"http://{host}:{port}"
     preview_url = "https://davia.ai"
 
@@ -61,6 +71,10 @@ def run_server(
         print(e)
         raise typer.Exit(code=1) from None
 
+    if hot_reload or zero_downtime:
+        # The app reloads itself in process, or is restarted by the supervisor
+        reload = False
+
     mod = importlib.import_module(import_data.module_data.module_import_str)
     app = getattr(mod, import_data.app_name)
 
@@ -68,11 +82,18 @@ def run_server(
         # Tasks only
         print(_welcome_message.format(preview_url=preview_url))
         load_dotenv()
-        uvicorn.run(
+        if hot_reload:
+            os.environ["DAVIA_HOT_RELOAD"] = "true"
+        if broker_url:
+            os.environ["DAVIA_BROKER_URL"] = broker_url
+        serve(
+            server,
             import_data.import_string,
-            host=host,
-            port=port,
+            host,
+            port,
             reload=reload,
+            zero_downtime=zero_downtime,
+            sys_path=[str(import_data.module_data.extra_sys_path)],
         )
     else:
         # Check Python version for LangGraph compatibility
@@ -104,10 +125,23 @@ def run_server(
         with patch_environment(
             MIGRATIONS_PATH="__inmem",
             DATABASE_URI=":memory:",
+            # The in-memory runtime does not use Redis, Davia jobs use DAVIA_BROKER_URL
             REDIS_URI="fake",
-            N_JOBS_PER_WORKER=str(n_jobs_per_worker if n_jobs_per_worker else 1),
+            N_JOBS_PER_WORKER=str(max(n_jobs_per_worker, max_jobs_per_worker)),
+            # The number of jobs adapts to the load when the maximum is above the minimum
+            DAVIA_MIN_JOBS_PER_WORKER=(
+                str(n_jobs_per_worker)
+                if max_jobs_per_worker > n_jobs_per_worker
+                else None
+            ),
             LANGSERVE_GRAPHS=json.dumps(graphs) if graphs else None,
             DAVIA_GRAPHS=json.dumps(app._graphs) if app._graphs else None,
+            DAVIA_DATABASE_PATH=(
+                Path(database_path).resolve().as_posix() if database_path else None
+            ),
+            DAVIA_GRAPH_WARMUP="true" if warmup else None,
+            DAVIA_HOT_RELOAD="true" if hot_reload else None,
+            DAVIA_BROKER_URL=broker_url,
             LANGSMITH_LANGGRAPH_API_VARIANT="local_dev",
             LANGGRAPH_HTTP=json.dumps({"app": f"{app_path}:{import_data.app_name}"}),
             # See https://developer.chrome.com/blog/private-network-access-update-2024-03
@@ -116,11 +150,13 @@ def run_server(
             print(_welcome_message.format(preview_url=preview_url))
             load_dotenv()
 
-            uvicorn.run(
-                "langgraph_api.server:app",
-                host=host,
-                port=port,
+            serve(
+                server,
+                "davia.runtime:app",
+                host,
+                port,
                 reload=reload,
+                zero_downtime=zero_downtime,
                 log_level="warning",
                 access_log=False,
                 log_config={
@@ -0,0 +1,237 @@
+import asyncio
+import fnmatch
+import functools
+import random
+import threading
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Callable, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel
+
+from davia.utils import set_signature, typed_signature
+
+# Lines of the allocation diffs kept for download
+MAX_DIFF_LINES = 500
+
+
+class Profiling(BaseModel):
+    """
+    Allocation tracking of the tasks and graphs with tracemalloc.
+
+    A sampled share of the invocations runs with tracemalloc on, and the memory
+    allocated and not freed by the end of each one is added up by allocation
+    site. Tracing only runs during the sampled invocations, so the overhead is
+    the one of tracemalloc times the sample rate. Invocations running at the
+    same time share the traces, so their allocations can be mixed up.
+
+    ## Example
+
+    ```python
+    from davia import Davia, Profiling
+
+    app = Davia(profiling=Profiling(tasks=["report_*"], sample_rate=0.05))
+    ```
+    """
+
+    tasks: list[str] = ["*"]
+    """Name patterns of the profiled tasks."""
+    graphs: list[str] = ["*"]
+    """Name patterns of the profiled graphs."""
+    sample_rate: float = 0.01
+    """Share of the invocations profiled, from 0 to 1."""
+    frames: int = 1
+    """Frames kept per allocation traceback, more frames cost more memory and time."""
+    top: int = 20
+    """Allocation sites kept per task or graph."""
+
+
+class AllocationSite(BaseModel):
+    traceback: list[str]
+    size_bytes: int
+    count: int
+
+
+class AllocationStats(BaseModel):
+    name: str
+    kind: str
+    invocations: int
+    samples: int
+    size_bytes: int
+    """Memory allocated and not freed by the end of the samples, summed."""
+    peak_bytes: int
+    """Highest memory traced during a sample."""
+    last_sample_at: Optional[datetime]
+    sites: list[AllocationSite]
+
+
+class ProfilingStats(BaseModel):
+    sample_rate: float
+    tracing: bool
+    profiles: list[AllocationStats]
+
+
+class _Profile:
+    def __init__(self, name: str, kind: str):
+        self.name = name
+        self.kind = kind
+        self.invocations = 0
+        self.samples = 0
+        self.size_bytes = 0
+        self.peak_bytes = 0
+        self.last_sample_at: Optional[datetime] = None
+        self.sites: dict[tuple[str, ...], list[int]] = {}
+        self.last_diff: list[str] = []
+
+
+class Profiler:
+    """Samples the invocations of the tasks and graphs and aggregates their allocations."""
+
+    def __init__(self, profiling: Profiling):
+        self.profiling = profiling
+        self.sample_rate = profiling.sample_rate
+        self._profiles: dict[tuple[str, str], _Profile] = {}
+        self._lock = threading.Lock()
+        self._active = 0
+        # Tracing started by the user is left on
+        self._owns_tracing = False
+
+    def selects(self, kind: str, name: str) -> bool:
+        patterns = self.profiling.tasks if kind == "task" else self.profiling.graphs
+        return any(fnmatch.fnmatchcase(name, pattern) for pattern in patterns)
+
+    def _profile(self, kind: str, name: str) -> _Profile:
+        profile = self._profiles.get((kind, name))
+        if profile is None:
+            profile = self._profiles[(kind, name)] = _Profile(name, kind)
+        return profile
+
+    def start(self, kind: str, name: str) -> Optional[tracemalloc.Snapshot]:
+        """Count an invocation, and start tracing it if sampled."""
+        with self._lock:
+            self._profile(kind, name).invocations += 1
+            if random.random() >= self.sample_rate:
+                return None
+            if self._active == 0 and not tracemalloc.is_tracing():
+                tracemalloc.start(self.profiling.frames)
+                self._owns_tracing = True
+            if self._active == 0:
+                tracemalloc.reset_peak()
+            self._active += 1
+            return tracemalloc.take_snapshot()
+
+    def stop(self, kind: str, name: str, before: tracemalloc.Snapshot):
+        """Add the allocations of a sampled invocation to its profile."""
+        with self._lock:
+            after = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            self._active -= 1
+            if self._active == 0 and self._owns_tracing:
+                tracemalloc.stop()
+                self._owns_tracing = False
+
+        # Allocations of the profiler itself are left out
+        filters = [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ]
+        diff = [
+            stat
+            for stat in after.filter_traces(filters).compare_to(
+                before.filter_traces(filters), "traceback"
+            )
+            if stat.size_diff or stat.count_diff
+        ]
+        with self._lock:
+            profile = self._profile(kind, name)
+            profile.samples += 1
+            profile.size_bytes += sum(stat.size_diff for stat in diff)
+            profile.peak_bytes = max(profile.peak_bytes, peak)
+            profile.last_sample_at = datetime.now(timezone.utc)
+            for stat in diff:
+                key = tuple(str(frame) for frame in stat.traceback)
+                site = profile.sites.setdefault(key, [0, 0])
+                site[0] += stat.size_diff
+                site[1] += stat.count_diff
+            profile.last_diff = [str(stat) for stat in diff[:MAX_DIFF_LINES]]
+
+    def stats(self) -> ProfilingStats:
+        with self._lock:
+            profiles = [
+                AllocationStats(
+                    name=profile.name,
+                    kind=profile.kind,
+                    invocations=profile.invocations,
+                    samples=profile.samples,
+                    size_bytes=profile.size_bytes,
+                    peak_bytes=profile.peak_bytes,
+                    last_sample_at=profile.last_sample_at,
+                    sites=[
+                        AllocationSite(
+                            traceback=list(traceback), size_bytes=size, count=count
+                        )
+                        for traceback, (size, count) in sorted(
+                            profile.sites.items(), key=lambda x: -x[1][0]
+                        )[: self.profiling.top]
+                    ],
+                )
+                for profile in self._profiles.values()
+            ]
+        return ProfilingStats(
+            sample_rate=self.sample_rate,
+            tracing=self._active > 0,
+            profiles=profiles,
+        )
+
+    def last_diff(self, kind: str, name: str) -> Optional[list[str]]:
+        """Get the allocation diff of the last sample, by site."""
+        profile = self._profiles.get((kind, name))
+        if profile is None or not profile.samples:
+            return None
+        return profile.last_diff
+
+    def reset(self):
+        with self._lock:
+            self._profiles.clear()
+
+
+def profiled(endpoint: Callable, name: str, profiler: Profiler) -> Callable:
+    """Wrap a route endpoint to profile the sampled invocations of a task."""
+    is_coroutine = asyncio.iscoroutinefunction(endpoint)
+
+    @functools.wraps(endpoint)
+    async def wrapper(*args, **kwargs):
+        before = profiler.start("task", name)
+        try:
+            if is_coroutine:
+                return await endpoint(*args, **kwargs)
+            return await run_in_threadpool(endpoint, *args, **kwargs)
+        finally:
+            if before is not None:
+                profiler.stop("task", name, before)
+
+    set_signature(wrapper, typed_signature(endpoint))
+    return wrapper
+
+
+def install(profiler: Profiler):
+    """Profile the graph runs of the LangGraph runtime queue."""
+    from langgraph_storage import queue
+
+    runtime_worker = queue.worker
+
+    async def worker(run, *args, **kwargs):
+        graph_id = (
+            run["kwargs"].get("config", {}).get("configurable", {}).get("graph_id")
+        )
+        if not graph_id or not profiler.selects("graph", graph_id):
+            return await runtime_worker(run, *args, **kwargs)
+        before = profiler.start("graph", graph_id)
+        try:
+            return await runtime_worker(run, *args, **kwargs)
+        finally:
+            if before is not None:
+                profiler.stop("graph", graph_id, before)
+
+    queue.worker = worker
@@ -0,0 +1,198 @@
+import ast
+import asyncio
+import importlib
+import importlib.util
+import inspect
+import logging
+import os
+import sys
+from pathlib import Path
+from typing import Any
+
+from davia import routers
+
+logger = logging.getLogger(__name__)
+
+
+def _module_file(module: Any) -> str:
+    file = getattr(module, "__file__", None)
+    return os.path.realpath(file) if file else ""
+
+
+def _imported_modules(namespace: dict) -> set[str]:
+    """
+    Get the modules imported by the source of a namespace.
+
+    Values imported with `from module import name`, such as constants, do not
+    refer to their module, so the module is found in the import statement.
+    """
+    file = namespace.get("__file__")
+    try:
+        tree = ast.parse(Path(file).read_text()) if file else None
+    except (OSError, SyntaxError, ValueError):
+        tree = None
+    if tree is None:
+        return set()
+
+    names: set[str] = set()
+    package = namespace.get("__package__") or ""
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            name = "." * node.level + (node.module or "")
+            try:
+                names.add(importlib.util.resolve_name(name, package))
+            except (ImportError, ValueError):
+                continue
+    return names
+
+
+class HotReloader:
+    """
+    In-process reload of a Davia app, executing again only the changed modules.
+
+    When a file changes, the modules loaded from it and the modules depending
+    on them are executed again, in dependency order. If the app module is
+    among them, its tasks and graphs are registered again on the live app.
+    Every other module, the sessions state and the threads of the graphs are
+    kept as they are. Modules are executed in a thread, so the event loop
+    keeps serving requests during the reload.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        app_file = app._source_globals.get("__file__")
+        self.app_file = os.path.realpath(app_file) if app_file else None
+        self.root = os.path.dirname(self.app_file) if app_file else None
+
+    async def run(self):
+        try:
+            from watchfiles import PythonFilter, awatch
+        except ImportError:
+            logger.warning("Hot reload requires watchfiles: pip install -U watchfiles")
+            return
+        if self.app_file is None:
+            logger.warning("Hot reload requires the app to be created by a module")
+            return
+
+        logger.info("Hot reload watching %s", self.root)
+        async for changes in awatch(self.root, watch_filter=PythonFilter()):
+            changed = {os.path.realpath(path) for _, path in changes}
+            try:
+                changed_app = await asyncio.to_thread(self.reload, changed)
+            except Exception:
+                logger.exception("Hot reload failed, the previous code is kept")
+                continue
+            # Clients are notified from the event loop
+            if changed_app:
+                self.app._changes.bump()
+
+    def _user_modules(self) -> dict[str, Any]:
+        """Get the modules loaded from the files of the app, by file."""
+        modules = {}
+        for module in list(sys.modules.values()):
+            file = _module_file(module)
+            if file.startswith(self.root + os.sep) and "site-packages" not in file:
+                modules[file] = module
+        return modules
+
+    def _dependencies(self, namespace: dict, modules: dict[str, Any]) -> set[str]:
+        """Get the files of the app modules a namespace refers to or imports from."""
+        names = _imported_modules(namespace)
+        for value in list(namespace.values()):
+            if inspect.ismodule(value):
+                names.add(value.__name__)
+            else:
+                module_name = getattr(value, "__module__", None)
+                if isinstance(module_name, str):
+                    names.add(module_name)
+        files = {_module_file(sys.modules.get(name)) for name in names}
+        return files & modules.keys()
+
+    def reload(self, changed: set[str]) -> bool:
+        """
+        Execute again the changed files and their dependents.
+
+        Returns whether the tasks, graphs or schemas of the app changed.
+        """
+        modules = self._user_modules()
+        namespaces = {file: vars(module) for file, module in modules.items()}
+        # The app and graph modules are not always in sys.modules
+        namespaces[self.app_file] = self.app._source_globals
+        for file, (_, module) in routers._modules.items():
+            namespaces.setdefault(os.path.realpath(file), vars(module))
+        dependencies = {
+            file: self._dependencies(namespace, modules)
+            for file, namespace in namespaces.items()
+        }
+
+        # Files to execute again: the changed ones and their dependents
+        affected = changed & namespaces.keys()
+        while True:
+            dependents = {
+                file
+                for file, files in dependencies.items()
+                if files & affected and file not in affected
+            }
+            if not dependents:
+                break
+            affected |= dependents
+        if not affected:
+            return False
+
+        # Execute the dependencies before their dependents
+        ordered: list[str] = []
+        visited: set[str] = set()
+
+        def visit(file: str):
+            if file in visited:
+                return
+            visited.add(file)
+            for dependency in sorted(dependencies[file] & affected):
+                visit(dependency)
+            ordered.append(file)
+
+        for file in sorted(affected):
+            visit(file)
+
+        graph_files = {os.path.realpath(file) for file in routers._modules}
+        for file in ordered:
+            # The app module is executed again by _reload_app, graph modules
+            # by their next load
+            if file in modules and file != self.app_file and file not in graph_files:
+                importlib.reload(modules[file])
+        # Graph modules are executed again on their next use
+        graphs_changed = False
+        for file in list(routers._modules):
+            if os.path.realpath(file) in affected:
+                del routers._modules[file]
+                graphs_changed = True
+        # Graph schemas are only known once the graphs are built again
+        changed_app = graphs_changed
+        if self.app_file in affected:
+            changed_app = self._reload_app() or changed_app
+        # Logged as a warning like the reloads of uvicorn, to be seen by default
+        logger.warning(
+            "Hot reloaded %s",
+            ", ".join(os.path.relpath(file, self.root) for file in ordered),
+        )
+        return changed_app
+
+    def _reload_app(self) -> bool:
+        namespace = self.app._source_globals
+        names = [name for name, value in namespace.items() if value is self.app]
+        code = compile(Path(self.app_file).read_text(), self.app_file, "exec")
+        try:
+            exec(code, namespace)
+            new_app = next(
+                (namespace[name] for name in names if namespace.get(name) is not None),
+                None,
+            )
+            if new_app is None or new_app is self.app:
+                raise RuntimeError(f"No Davia app found in {self.app_file}")
+            return self.app._reload_from(new_app)
+        finally:
+            # The module keeps serving the live app
+            for name in names:
+                namespace[name] = self.app
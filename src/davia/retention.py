@@ -0,0 +1,212 @@
+import asyncio
+import logging
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+# Share of the idle threads deleted on each sweep while above the memory high-water mark
+_HIGH_WATER_EVICTION_RATIO = 0.1
+
+
+class Retention(BaseModel):
+    """
+    Retention policy for the threads, runs and checkpoints kept by the LangGraph runtime.
+
+    ## Example
+
+    ```python
+    from davia import Davia, Retention
+
+    app = Davia(retention=Retention(max_threads=1000, thread_ttl=24 * 3600))
+    ```
+    """
+
+    max_threads: Optional[int] = None
+    """Maximum number of threads, the least recently updated idle ones are deleted first."""
+    thread_ttl: Optional[float] = None
+    """Seconds since the last activity after which an idle thread is deleted."""
+    max_checkpoints_per_thread: Optional[int] = None
+    """Maximum number of checkpoints kept per thread and namespace, the oldest are deleted first."""
+    memory_high_water_mark: Optional[int] = None
+    """Resident memory in bytes above which the least recently updated idle threads are deleted."""
+    sweep_interval: float = 60.0
+    """Seconds between two sweeps."""
+
+
+class RetentionStats(BaseModel):
+    threads: int
+    runs: int
+    checkpoints: int
+    rss_bytes: int
+    sweeps: int
+    threads_deleted: int
+    checkpoints_deleted: int
+    last_sweep_at: Optional[datetime]
+
+
+class RetentionSweeper:
+    """Background sweeper enforcing a retention policy on the LangGraph runtime."""
+
+    def __init__(self, retention: Retention):
+        self.retention = retention
+        self.sweeps = 0
+        self.threads_deleted = 0
+        self.checkpoints_deleted = 0
+        self.last_sweep_at: Optional[datetime] = None
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.retention.sweep_interval)
+            try:
+                await self.sweep()
+            except Exception:
+                logger.exception("Retention sweep failed")
+
+    async def sweep(self):
+        """Delete the threads and checkpoints exceeding the retention policy."""
+        from langgraph_storage.checkpoint import Checkpointer
+        from langgraph_storage.database import connect
+        from langgraph_storage.ops import Threads
+
+        async with connect() as conn:
+            checkpointer = Checkpointer(conn)
+
+            for thread_id in self._threads_to_delete(conn.store):
+                try:
+                    await Threads.delete(conn, thread_id)
+                except Exception:
+                    # A thread deleted meanwhile does not stop the sweep
+                    logger.exception("Failed to delete thread %s", thread_id)
+                    continue
+                # The runtime leaves the channel values of deleted threads behind
+                _delete_blobs(checkpointer, str(thread_id))
+                self.threads_deleted += 1
+
+            if self.retention.max_checkpoints_per_thread is not None:
+                self.checkpoints_deleted += _trim_checkpoints(
+                    checkpointer, self.retention.max_checkpoints_per_thread
+                )
+
+        self.sweeps += 1
+        self.last_sweep_at = datetime.now(timezone.utc)
+
+    def _threads_to_delete(self, store) -> list:
+        busy = {
+            run["thread_id"]
+            for run in store["runs"]
+            if run["status"] in ("pending", "running")
+        }
+        threads = store["threads"]
+        # Least recently updated first
+        idle = sorted(
+            (
+                thread
+                for thread in threads
+                if thread["status"] != "busy" and thread["thread_id"] not in busy
+            ),
+            key=lambda thread: thread["updated_at"],
+        )
+
+        expired = []
+        if self.retention.thread_ttl is not None:
+            limit = datetime.now(timezone.utc) - timedelta(
+                seconds=self.retention.thread_ttl
+            )
+            expired = [thread for thread in idle if thread["updated_at"] < limit]
+        remaining = idle[len(expired) :]
+
+        excess = 0
+        if self.retention.max_threads is not None:
+            excess = len(threads) - len(expired) - self.retention.max_threads
+        if (
+            self.retention.memory_high_water_mark is not None
+            and rss_bytes() > self.retention.memory_high_water_mark
+        ):
+            excess = max(excess, int(len(remaining) * _HIGH_WATER_EVICTION_RATIO), 1)
+        if excess > 0:
+            expired += remaining[:excess]
+
+        return [thread["thread_id"] for thread in expired]
+
+    async def stats(self) -> RetentionStats:
+        from langgraph_storage.checkpoint import Checkpointer
+        from langgraph_storage.database import connect
+
+        async with connect() as conn:
+            checkpointer = Checkpointer(conn)
+            return RetentionStats(
+                threads=len(conn.store["threads"]),
+                runs=len(conn.store["runs"]),
+                checkpoints=sum(
+                    len(checkpoints)
+                    for namespaces in checkpointer.storage.values()
+                    for checkpoints in namespaces.values()
+                ),
+                rss_bytes=rss_bytes(),
+                sweeps=self.sweeps,
+                threads_deleted=self.threads_deleted,
+                checkpoints_deleted=self.checkpoints_deleted,
+                last_sweep_at=self.last_sweep_at,
+            )
+
+
+def _delete_blobs(checkpointer, thread_id: str):
+    for key in [key for key in checkpointer.blobs.keys() if key[0] == thread_id]:
+        del checkpointer.blobs[key]
+
+
+def _trim_checkpoints(checkpointer, max_checkpoints: int) -> int:
+    """Delete the oldest checkpoints of each thread, returning how many were deleted."""
+    deleted = 0
+    trimmed = []
+    for thread_id, namespaces in list(checkpointer.storage.items()):
+        for checkpoint_ns, checkpoints in namespaces.items():
+            if len(checkpoints) <= max_checkpoints:
+                continue
+            # Checkpoint ids are ordered by creation time
+            checkpoint_ids = sorted(checkpoints)
+            for checkpoint_id in checkpoint_ids[:-max_checkpoints]:
+                del checkpointer.storage[thread_id][checkpoint_ns][checkpoint_id]
+                checkpointer.writes.pop((thread_id, checkpoint_ns, checkpoint_id), None)
+                deleted += 1
+            trimmed.append((thread_id, checkpoint_ns))
+
+    if not trimmed:
+        return deleted
+
+    # Only keep the channel values referenced by the remaining checkpoints
+    referenced: set[tuple] = set()
+    for thread_id, checkpoint_ns in trimmed:
+        for checkpoint, _, _ in checkpointer.storage[thread_id][checkpoint_ns].values():
+            versions = checkpointer.serde.loads_typed(checkpoint)["channel_versions"]
+            referenced.update(
+                (thread_id, checkpoint_ns, channel, version)
+                for channel, version in versions.items()
+            )
+    trimmed_namespaces = set(trimmed)
+    for key in list(checkpointer.blobs.keys()):
+        if key[:2] in trimmed_namespaces and key not in referenced:
+            del checkpointer.blobs[key]
+
+    return deleted
+
+
+def rss_bytes() -> int:
+    """Resident memory of the process in bytes."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return 0
+    # Peak resident memory, the best available without /proc
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return usage if sys.platform == "darwin" else usage * 1024
@@ -1,5 +1,11 @@
+import asyncio
+import fnmatch
+import hashlib
 import json
 import os
+import re
+import sys
+import uuid
 from typing import (
     Any,
     Optional,
@@ -13,16 +19,27 @@ from typing import (
 from pathlib import Path
 import importlib.util
 import inspect
-from fastapi import APIRouter, Request, HTTPException
+from fastapi import APIRouter, Query, Request, Response, HTTPException, WebSocket
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from dataclasses import fields, is_dataclass
 import httpx
 
 from davia._version import __version__
-from davia.state import State
+from davia.state import DEFAULT_SESSION, SESSION_HEADER, State, get_state
+from davia.retention import RetentionStats
+from davia.scheduler import SchedulerStats
+from davia.profiling import ProfilingStats
+from davia.jobs import JobBroker, graph_queue, task_queue
+from davia.websocket import TaskSocket
 
 router = APIRouter(prefix="/davia")
 
+# Header holding the cursor of the next page of graph schemas
+NEXT_CURSOR_HEADER = "X-Davia-Next-Cursor"
+# Assistants read per search of the runtime when looking for the latest ones
+ASSISTANTS_PAGE_SIZE = 1000
+
 
 class Schema(BaseModel):
     name: str
@@ -40,6 +57,115 @@ async def davia_info() -> dict:
     }
 
 
+@router.get("/retention", include_in_schema=False, tags=["Davia graphs"])
+async def retention_stats(request: Request) -> RetentionStats:
+    """Get the retention statistics of the threads, runs and checkpoints."""
+    sweeper = getattr(request.app, "_retention_sweeper", None)
+    if sweeper is None:
+        raise HTTPException(status_code=404, detail="Retention is not enabled")
+    return await sweeper.stats()
+
+
+@router.get("/events", include_in_schema=False)
+async def change_events(request: Request) -> StreamingResponse:
+    """
+    Stream a `changed` event with a new version each time the tasks, graphs or
+    schemas of the app change, so clients fetch them again only then.
+
+    Reconnecting clients send back the version they have as `Last-Event-ID`.
+    """
+    last_event_id = request.headers.get("last-event-id", "")
+    last_version = int(last_event_id) if last_event_id.isdigit() else None
+    return StreamingResponse(
+        request.app._changes.stream(last_version),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
+
+
+@router.get("/scheduler", include_in_schema=False, tags=["Davia graphs"])
+async def scheduler_stats(request: Request) -> SchedulerStats:
+    """Get the run concurrency of the graphs and the decisions that set it."""
+    scheduler = getattr(request.app, "_scheduler", None)
+    if scheduler is None:
+        raise HTTPException(
+            status_code=404, detail="Adaptive concurrency is not enabled"
+        )
+    return scheduler.stats()
+
+
+def _profiler(request: Request):
+    profiler = getattr(request.app, "_profiler", None)
+    if profiler is None:
+        raise HTTPException(status_code=404, detail="Profiling is not enabled")
+    return profiler
+
+
+@router.get("/profiling", include_in_schema=False)
+async def profiling_stats(request: Request) -> ProfilingStats:
+    """Get the top allocation sites of the profiled tasks and graphs."""
+    return _profiler(request).stats()
+
+
+@router.patch("/profiling", include_in_schema=False)
+async def set_profiling_sample_rate(
+    request: Request, sample_rate: float
+) -> ProfilingStats:
+    """Change the share of the invocations profiled, 0 to pause the profiling."""
+    profiler = _profiler(request)
+    if not 0 <= sample_rate <= 1:
+        raise HTTPException(
+            status_code=400, detail="The sample rate must be between 0 and 1"
+        )
+    profiler.sample_rate = sample_rate
+    return profiler.stats()
+
+
+@router.delete("/profiling", include_in_schema=False, status_code=204)
+async def reset_profiling(request: Request):
+    """Forget the allocations profiled so far."""
+    _profiler(request).reset()
+
+
+@router.get("/profiling/{kind}/{name}/diff", include_in_schema=False)
+async def profiling_diff(request: Request, kind: str, name: str) -> Response:
+    """Download the allocation diff of the last profiled invocation of a task or graph."""
+    if kind not in ("task", "graph"):
+        raise HTTPException(status_code=404, detail="Kind must be task or graph")
+    diff = _profiler(request).last_diff(kind, name)
+    if diff is None:
+        raise HTTPException(
+            status_code=404, detail=f"No profiled invocation of the {kind} '{name}'"
+        )
+    return Response(
+        "\n".join(diff) + "\n",
+        media_type="text/plain",
+        headers={
+            "Content-Disposition": f'attachment; filename="{kind}-{name}.diff.txt"'
+        },
+    )
+
+
+@router.get("/state", include_in_schema=False)
+async def session_state(
+    request: Request, keys: Optional[list[str]] = Query(None)
+) -> Dict[str, Any]:
+    """Get the state of the session, optionally restricted to some keys."""
+    session_id = request.headers.get(SESSION_HEADER, DEFAULT_SESSION)
+    values = request.app._state_backend.items(session_id)
+    return {
+        key: json.loads(value)
+        for key, value in values.items()
+        if keys is None or key in keys
+    }
+
+
+@router.websocket("/ws")
+async def task_socket(websocket: WebSocket):
+    """Multiplex task calls over a WebSocket connection."""
+    await TaskSocket(websocket).serve()
+
+
 @router.get(
     "/graph-config/{graph_name}", include_in_schema=False, tags=["Davia graphs"]
 )
@@ -68,7 +194,8 @@ async def graph_config(request: Request, graph_name: str) -> Dict[str, Any]:
 
         # Check if it has a default value
         if param.default != inspect.Parameter.empty:
-            return param.default
+            # `config: Optional[dict] = None` has no default config
+            return param.default if param.default is not None else {}
         else:
             # Config parameter exists but no default value
             import warnings
@@ -83,62 +210,289 @@ async def graph_config(request: Request, graph_name: str) -> Dict[str, Any]:
 
 
 @router.get("/graph-schemas", include_in_schema=False, tags=["Davia graphs"])
-async def graph_schemas(request: Request) -> list[Schema]:
-    """Get all registered graph schemas with their complete information."""
-    url = str(request.base_url).rstrip("/")
-
+async def graph_schemas(
+    request: Request,
+    response: Response,
+    name: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1),
+    fields: Optional[list[str]] = Query(None),
+) -> list[Dict[str, Any]]:
+    """
+    Get the registered graph schemas with their complete information.
+
+    Graphs are sorted by name and filtered with the `name` shell-style pattern.
+    With a `limit`, the `cursor` of the next page is sent in the
+    `X-Davia-Next-Cursor` header. `fields` restricts the fields of the schemas,
+    the others are not computed.
+
+    The docstring and source file come from the graph registration, only the
+    state schema needs the graph module to be imported. Leave it out of
+    `fields` to list graphs without importing them.
+    """
     graphs = json.loads(os.environ.get("LANGSERVE_GRAPHS", "{}"))
+    graphs_data = json.loads(os.environ.get("DAVIA_GRAPHS") or "{}")
 
-    if not graphs:
-        return []
-
-    graphs_metadata = {}
-    for name, path in graphs.items():
-        # Inspect the function
-        function_info = inspect_function_from_path(path)
-        graphs_metadata[name] = function_info
+    names = sorted(
+        graph_id
+        for graph_id in graphs
+        if (name is None or fnmatch.fnmatchcase(graph_id, name))
+        and (cursor is None or graph_id > cursor)
+    )
+    if limit is not None and len(names) > limit:
+        names = names[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = names[-1]
+
+    selected = set(fields) if fields else set(Schema.model_fields)
+    unknown = selected - Schema.model_fields.keys()
+    if unknown:
+        raise HTTPException(
+            status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}"
+        )
 
+    # Graphs without an assistant are not served yet, so they are left out
+    url = str(request.base_url).rstrip("/")
     async with httpx.AsyncClient() as client:
-        response = await client.post(f"{url}/assistants/search", json={})
-        assistants_data = response.json()
+        assistants = await _latest_assistants(client, url, names)
+        found = [
+            (graph_id, assistants[graph_id])
+            for graph_id in names
+            if graph_id in assistants
+        ]
+        state_schemas = {}
+        if "user_state_snapshot" in selected:
+            responses = await asyncio.gather(
+                *(
+                    client.get(f"{url}/assistants/{assistant['assistant_id']}/schemas")
+                    for _, assistant in found
+                )
+            )
+            state_schemas = {
+                graph_id: response.json()["state_schema"]
+                for (graph_id, _), response in zip(found, responses)
+            }
+
+    schemas = []
+    for graph_id, _ in found:
+        metadata = graphs_data.get(graph_id, {})
+        schema = {
+            "name": graph_id,
+            "docstring": metadata.get("docstring"),
+            "source_file": metadata.get("source_file"),
+            "user_state_snapshot": state_schemas.get(graph_id),
+        }
+        schemas.append(
+            {key: schema[key] for key in Schema.model_fields if key in selected}
+        )
+    return schemas
+
 
-    # Sort all assistants by updated_at in descending order
-    sorted_assistants = sorted(
-        assistants_data, key=lambda x: x["updated_at"], reverse=True
+async def _latest_assistants(
+    client: httpx.AsyncClient, url: str, graph_ids: list[str]
+) -> dict[str, dict[str, Any]]:
+    """Get the most recently updated assistant of each graph, with one search per graph."""
+    assistants = await asyncio.gather(
+        *(_latest_assistant(client, url, graph_id) for graph_id in graph_ids)
     )
+    return {
+        graph_id: assistant
+        for graph_id, assistant in zip(graph_ids, assistants)
+        if assistant is not None
+    }
 
-    # Create a dictionary to keep only the most recent assistant for each graph_id
-    latest_assistants = {}
-    for assistant in sorted_assistants:
-        if (
-            assistant["graph_id"] in graphs.keys()
-            and assistant["graph_id"] not in latest_assistants
-        ):
-            latest_assistants[assistant["graph_id"]] = assistant
 
-    graph_schemas = {}
+async def _latest_assistant(
+    client: httpx.AsyncClient, url: str, graph_id: str
+) -> Optional[dict[str, Any]]:
+    """Get the most recently updated assistant of a graph, filtered by the store."""
+    latest: Optional[dict[str, Any]] = None
+    offset = 0
+    while True:
+        # The store sorts by creation time, so every version of the graph is read
+        response = await client.post(
+            f"{url}/assistants/search",
+            json={
+                "graph_id": graph_id,
+                "limit": ASSISTANTS_PAGE_SIZE,
+                "offset": offset,
+            },
+        )
+        page = response.json()
+        for assistant in page:
+            if latest is None or assistant["updated_at"] > latest["updated_at"]:
+                latest = assistant
+        if len(page) < ASSISTANTS_PAGE_SIZE:
+            return latest
+        offset += len(page)
+
+
+@router.post("/jobs/tasks/{task_name}", include_in_schema=False, status_code=202)
+async def enqueue_task_job(
+    request: Request, task_name: str, timeout: Optional[float] = None
+) -> Dict[str, Any]:
+    """
+    Queue a call of a task, run by any process sharing the job broker.
+
+    The body holds the arguments of the task by name.
+    """
+    if task_name not in request.app._tasks:
+        raise HTTPException(status_code=404, detail=f"Task '{task_name}' not found")
+    headers = {}
+    if SESSION_HEADER in request.headers:
+        headers[SESSION_HEADER] = request.headers[SESSION_HEADER]
+    job = {
+        "kind": "task",
+        "task": task_name,
+        "args": await request.json() if await request.body() else {},
+        "headers": headers,
+        "timeout": timeout,
+    }
+    return await _enqueue_job(request, task_queue(task_name), job)
+
+
+@router.post("/jobs/graphs/{graph_id}", include_in_schema=False, status_code=202)
+async def enqueue_graph_job(request: Request, graph_id: str) -> Dict[str, Any]:
+    """
+    Queue a stateless run of a graph, run by any process sharing the job broker.
+
+    The body is the one of the runtime `/runs/wait` route.
+    """
+    if graph_id not in json.loads(os.getenv("DAVIA_GRAPHS") or "{}"):
+        raise HTTPException(status_code=404, detail=f"Graph '{graph_id}' not found")
+    job = {
+        "kind": "graph",
+        "graph": graph_id,
+        "payload": await request.json() if await request.body() else {},
+    }
+    return await _enqueue_job(request, graph_queue(graph_id), job)
+
+
+def _job_broker(request: Request) -> JobBroker:
+    broker = request.app._job_broker
+    if broker is None:
+        raise HTTPException(
+            status_code=503, detail="Jobs are disabled, no broker_url is configured"
+        )
+    return broker
+
+
+async def _enqueue_job(request: Request, queue: str, job: dict) -> Dict[str, Any]:
+    broker = _job_broker(request)
+    job_id = str(uuid.uuid4())
+    status = {"job_id": job_id, "status": "queued"}
+    await broker.set_status(job_id, status)
+    await broker.enqueue(queue, {**job, "job_id": job_id})
+    return status
+
+
+@router.get("/jobs/{job_id}", include_in_schema=False)
+async def job_status(request: Request, job_id: str) -> Dict[str, Any]:
+    """Get the status of a job, with its result once done."""
+    status = await _job_broker(request).get_status(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found")
+    return status
+
+
+@router.get("/jobs/{job_id}/stream", include_in_schema=False)
+async def job_stream(request: Request, job_id: str) -> StreamingResponse:
+    """Stream the `partial` results of a job and its `result` event, from any process."""
+    broker = _job_broker(request)
+    # Subscribed before reading the status so the result cannot be missed
+    subscription = await broker.subscribe(job_id)
+    status = await broker.get_status(job_id)
+    if status is None:
+        await subscription.close()
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found")
+
+    async def events():
+        try:
+            if status["status"] == "done":
+                yield f"event: result\ndata: {json.dumps(status)}\n\n"
+                return
+            while True:
+                message = await subscription.get()
+                yield f"event: {message['event']}\ndata: {json.dumps(message['data'])}\n\n"
+                if message["event"] == "result":
+                    return
+        finally:
+            await subscription.close()
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@router.get(
+    "/threads/{thread_id}/state-sync", include_in_schema=False, tags=["Davia graphs"]
+)
+async def thread_state_sync(
+    request: Request, thread_id: str, version: Optional[str] = None
+) -> Dict[str, Any]:
+    """Get the changes of a thread state since the version the client has."""
+    url = str(request.base_url).rstrip("/")
+
     async with httpx.AsyncClient() as client:
-        for assistant in latest_assistants.values():
-            response = await client.get(
-                f"{url}/assistants/{assistant['assistant_id']}/schemas"
-            )
-            graph_id = assistant["graph_id"]
-            if graph_id in graphs.keys():
-                graph_schemas[graph_id] = {
-                    "assistant_schema": response.json()["state_schema"]
-                }
-            # add the metadata to the graph_schemas
-            graph_schemas[graph_id]["metadata"] = graphs_metadata[graph_id]
-    # return under the appropriate schema : Schema
-    return [
-        Schema(
-            name=graph_id,
-            docstring=graph_schemas[graph_id]["metadata"]["docstring"],
-            source_file=graph_schemas[graph_id]["metadata"]["source_file"],
-            user_state_snapshot=graph_schemas[graph_id]["assistant_schema"],
+        response = await client.get(f"{url}/threads/{thread_id}/state")
+    if response.status_code != 200:
+        raise HTTPException(
+            status_code=response.status_code, detail=response.json().get("detail")
         )
-        for graph_id in graph_schemas.keys()
-    ]
+
+    state_sync = request.app._state_sync.get(thread_id)
+    state_sync.update(response.json()["values"])
+    return state_sync.delta(version)
+
+
+@router.post(
+    "/threads/{thread_id}/runs/stream",
+    include_in_schema=False,
+    tags=["Davia graphs"],
+)
+async def thread_runs_stream(
+    request: Request, thread_id: str, version: Optional[str] = None
+) -> StreamingResponse:
+    """
+    Run a graph on a thread, streaming its state as patches instead of full values.
+
+    The body is the one of the runtime `/threads/{thread_id}/runs/stream` route,
+    the stream mode is always `values`. Each state is sent as a `patch` event
+    against the previous one, or as a `values` event holding a full snapshot.
+    """
+    url = str(request.base_url).rstrip("/")
+    payload = await request.json()
+    payload["stream_mode"] = "values"
+    state_sync = request.app._state_sync.get(thread_id)
+
+    async def events():
+        since = version
+        async with httpx.AsyncClient(timeout=None) as client:
+            async with client.stream(
+                "POST", f"{url}/threads/{thread_id}/runs/stream", json=payload
+            ) as response:
+                async for event, data in _read_events(response):
+                    if event == "values":
+                        state_sync.update(json.loads(data))
+                        delta = state_sync.delta(since)
+                        since = delta["version"]
+                        event = "patch" if "patch" in delta else "values"
+                        data = json.dumps(delta)
+                    yield f"event: {event}\ndata: {data}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+async def _read_events(response: httpx.Response):
+    """Read the (event, data) pairs of a server-sent events response."""
+    event, data = None, []
+    async for line in response.aiter_lines():
+        if line.startswith("event:"):
+            event = line[len("event:") :].strip()
+        elif line.startswith("data:"):
+            data.append(line[len("data:") :].strip())
+        elif not line and event is not None:
+            yield event, "\n".join(data)
+            event, data = None, []
+    if event is not None:
+        yield event, "\n".join(data)
 
 
 def convert_type_to_str(type_obj: Any) -> Union[str, Dict[str, Any]]:
@@ -228,6 +582,48 @@ def convert_type_to_str(type_obj: Any) -> Union[str, Dict[str, Any]]:
     return {"type": "Unknown", "value": str(type_obj)}
 
 
+# Loaded modules by path, with the modification time of their source file
+_modules: Dict[str, tuple[float, Any]] = {}
+
+
+def module_name(module_path: str) -> str:
+    """Get the name of a module loaded from its file, unique to the file and stable across loads."""
+    path = os.path.realpath(module_path)
+    stem = re.sub(r"\W", "_", Path(path).stem)
+    digest = hashlib.sha1(path.encode()).hexdigest()[:12]
+    return f"_davia_{stem}_{digest}"
+
+
+def load_module(module_path: str) -> Any:
+    """Load a module from its file, executing it again only if the file changed."""
+    mtime = os.path.getmtime(module_path)
+    cached = _modules.get(module_path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    # Create a module spec
+    name = module_name(module_path)
+    spec = importlib.util.spec_from_file_location(name, module_path)
+    if spec is None or spec.loader is None:
+        raise ImportError(f"Could not load module from {module_path}")
+
+    # Load the module, registered first so the classes it defines can be pickled
+    module = importlib.util.module_from_spec(spec)
+    previous = sys.modules.get(name)
+    sys.modules[name] = module
+    try:
+        spec.loader.exec_module(module)
+    except BaseException:
+        if previous is None:
+            del sys.modules[name]
+        else:
+            sys.modules[name] = previous
+        raise
+
+    _modules[module_path] = (mtime, module)
+    return module
+
+
 def get_function_from_path(path: str) -> Callable:
     """Get a function from its path string (module:function)."""
     # Split the path into module path and function name, using the last colon as separator
@@ -245,14 +641,7 @@ def get_function_from_path(path: str) -> Callable:
     if not os.path.isabs(module_path):
         module_path = str(Path(module_path).resolve())
 
-    # Create a module spec
-    spec = importlib.util.spec_from_file_location("module", module_path)
-    if spec is None or spec.loader is None:
-        raise ImportError(f"Could not load module from {module_path}")
-
-    # Load the module
-    module = importlib.util.module_from_spec(spec)
-    spec.loader.exec_module(module)
+    module = load_module(module_path)
 
     # Get the function object itself
     func = getattr(module, function_name)
@@ -298,10 +687,8 @@ def inspect_function_from_path(path: str) -> dict:
                 continue
 
             # Skip Annotated State parameters
-            if get_origin(param.annotation) is Annotated:
-                base_type, *metadata = get_args(param.annotation)
-                if any(type(m) is State for m in metadata):
-                    continue
+            if get_state(param.annotation) is not None:
+                continue
             parameters[name] = convert_type_to_str(param.annotation)
 
         # Get return type
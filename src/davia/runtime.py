@@ -0,0 +1,82 @@
+"""
+ASGI entrypoint used by `run_server` when the app defines graphs.
+
+It configures the in-memory LangGraph runtime from the `DAVIA_*` environment
+variables set by `run_server`, then serves `langgraph_api.server:app`.
+"""
+
+import asyncio
+import json
+import os
+from contextlib import asynccontextmanager
+
+database = None
+if os.getenv("DAVIA_DATABASE_PATH"):
+    from davia import storage
+
+    # Must run before the runtime server is imported
+    database = storage.install(os.environ["DAVIA_DATABASE_PATH"])
+
+from langgraph_api import graph as runtime_graph  # noqa: E402
+from langgraph_api.server import app  # noqa: E402
+
+from davia.graphs import registry  # noqa: E402
+from davia import scheduler as runs_scheduler  # noqa: E402
+from davia import profiling  # noqa: E402
+from davia.servers import notify_ready  # noqa: E402
+
+graphs = json.loads(os.getenv("DAVIA_GRAPHS") or "{}")
+
+scheduler = None
+if os.getenv("DAVIA_MIN_JOBS_PER_WORKER"):
+    # N_JOBS_PER_WORKER is the maximum, the scheduler adapts the limit below it
+    scheduler = runs_scheduler.AdaptiveScheduler(
+        int(os.environ["DAVIA_MIN_JOBS_PER_WORKER"]),
+        int(os.environ["N_JOBS_PER_WORKER"]),
+    )
+    runs_scheduler.install(scheduler)
+
+_runtime_lifespan = app.router.lifespan_context
+_graph_from_spec = runtime_graph._graph_from_spec
+
+
+def graph_from_spec(spec):
+    # Serve Davia graphs from the compile-once registry
+    if spec.id in graphs:
+        return registry.factory(spec.id, graphs[spec.id]["source_file"])
+    return _graph_from_spec(spec)
+
+
+runtime_graph._graph_from_spec = graph_from_spec
+
+
+@asynccontextmanager
+async def lifespan(app):
+    background_tasks = []
+    try:
+        async with _runtime_lifespan(app) as state:
+            if os.getenv("DAVIA_GRAPH_WARMUP") == "true":
+                await asyncio.to_thread(registry.warm_up, graphs)
+            if database is not None:
+                background_tasks.append(asyncio.create_task(database.flush_loop()))
+            if scheduler is not None:
+                app._scheduler = scheduler
+                background_tasks.append(asyncio.create_task(scheduler.run()))
+            # The Davia app is mounted as the runtime custom app
+            sweeper = getattr(app, "_retention_sweeper", None)
+            if sweeper is not None:
+                background_tasks.append(asyncio.create_task(sweeper.run()))
+            profiler = getattr(app, "_profiler", None)
+            if profiler is not None:
+                profiling.install(profiler)
+            notify_ready()
+            yield state
+    finally:
+        for task in background_tasks:
+            task.cancel()
+        # Closed last, the runtime shutdown still writes to the database
+        if database is not None:
+            database.close()
+
+
+app.router.lifespan_context = lifespan
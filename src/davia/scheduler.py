@@ -0,0 +1,168 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+# Event loop lag in seconds above which the run concurrency is lowered
+LAG_HIGH_WATER_MARK = 0.1
+# Share of a CPU used by the process above which the run concurrency is lowered
+CPU_HIGH_WATER_MARK = 0.9
+# Number of decisions kept for the metrics
+MAX_DECISIONS = 32
+
+
+class SchedulerDecision(BaseModel):
+    at: datetime
+    limit: int
+    reason: str
+
+
+class SchedulerStats(BaseModel):
+    limit: int
+    min_jobs: int
+    max_jobs: int
+    active: int
+    pending: int
+    loop_lag: float
+    cpu: float
+    decisions: list[SchedulerDecision]
+
+
+class AdaptiveScheduler:
+    """
+    Run concurrency of the LangGraph runtime adapted to the load.
+
+    The limit is raised while runs are queued and every slot is busy, which
+    is the case of runs waiting on I/O, and lowered when the event loop lags
+    or the process saturates its CPU, which is the case of CPU-bound runs.
+    """
+
+    def __init__(self, min_jobs: int, max_jobs: int, interval: float = 1.0):
+        self.min_jobs = min_jobs
+        self.max_jobs = max_jobs
+        self.interval = interval
+        self.limit = min_jobs
+        self.active = 0
+        self.pending = 0
+        self.loop_lag = 0.0
+        self.cpu = 0.0
+        self.decisions: deque[SchedulerDecision] = deque(maxlen=MAX_DECISIONS)
+        self._waiters: list[asyncio.Future] = []
+
+    async def acquire(self):
+        """Wait for a run slot."""
+        while self.active >= self.limit:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+        self.active += 1
+
+    def release(self):
+        self.active -= 1
+        self._wake()
+
+    def _wake(self):
+        for waiter in self._waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+        self._waiters.clear()
+
+    def _set_limit(self, limit: int, reason: str):
+        limit = max(self.min_jobs, min(self.max_jobs, limit))
+        if limit == self.limit:
+            return
+        logger.info("Run concurrency %d -> %d (%s)", self.limit, limit, reason)
+        self.limit = limit
+        self.decisions.append(
+            SchedulerDecision(at=datetime.now(timezone.utc), limit=limit, reason=reason)
+        )
+        self._wake()
+
+    def adjust(self, pending: int, loop_lag: float, cpu: float):
+        """Raise or lower the limit from the last measures."""
+        self.pending = pending
+        self.loop_lag = loop_lag
+        self.cpu = cpu
+        if loop_lag > LAG_HIGH_WATER_MARK:
+            self._set_limit(self.limit * 3 // 4, "event loop lag")
+        elif cpu > CPU_HIGH_WATER_MARK:
+            self._set_limit(self.limit * 3 // 4, "cpu")
+        elif pending and self.active >= self.limit:
+            # Up to twice the limit at once, as long as runs are queued
+            self._set_limit(self.limit + min(pending, self.limit), "queued runs")
+        elif not pending and self.active < self.limit // 2:
+            self._set_limit(self.limit - 1, "idle")
+
+    async def run(self):
+        """Measure the load and adjust the limit at each interval."""
+        from langgraph_storage.database import connect
+        from langgraph_storage.ops import Runs
+
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            cpu_started = time.process_time()
+            await asyncio.sleep(self.interval)
+            elapsed = loop.time() - started
+            try:
+                async with connect() as conn:
+                    stats = await Runs.stats(conn)
+            except Exception:
+                logger.exception("Failed to get the queue stats")
+                continue
+            self.adjust(
+                stats["n_pending"],
+                loop_lag=max(0.0, elapsed - self.interval),
+                cpu=(time.process_time() - cpu_started) / elapsed,
+            )
+
+    def stats(self) -> SchedulerStats:
+        return SchedulerStats(
+            limit=self.limit,
+            min_jobs=self.min_jobs,
+            max_jobs=self.max_jobs,
+            active=self.active,
+            pending=self.pending,
+            loop_lag=self.loop_lag,
+            cpu=self.cpu,
+            decisions=list(self.decisions),
+        )
+
+
+def install(scheduler: AdaptiveScheduler):
+    """Gate the runs of the LangGraph runtime queue with the scheduler."""
+    from langgraph_storage import ops, queue
+
+    runtime_worker = queue.worker
+
+    class Runs(ops.Runs):
+        @staticmethod
+        async def next(wait: bool, limit: int = 1):
+            # A run is only taken from the queue once it has a slot
+            await scheduler.acquire()
+            dequeued = False
+            try:
+                async for run, attempt in ops.Runs.next(wait=wait, limit=limit):
+                    dequeued = True
+                    yield run, attempt
+            finally:
+                if not dequeued:
+                    scheduler.release()
+
+    async def worker(*args, **kwargs):
+        try:
+            return await runtime_worker(*args, **kwargs)
+        finally:
+            scheduler.release()
+
+    queue.Runs = Runs
+    queue.worker = worker
@@ -0,0 +1,309 @@
+"""
+ASGI servers running a Davia app, and the supervisor restarting them without downtime.
+"""
+
+import json
+import logging
+import math
+import os
+import select
+import signal
+import socket
+import subprocess
+import sys
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# Seconds a generation has to finish its in-flight requests once replaced
+DRAIN_TIMEOUT = 30.0
+# Seconds a new generation has to start before the restart is given up
+READY_TIMEOUT = 120.0
+# Environment variables passed to the generations
+_SERVER_ENV = "DAVIA_SERVER"
+_READY_FD_ENV = "DAVIA_READY_FD"
+# Serves one generation on the socket inherited from the supervisor
+_GENERATION_COMMAND = "from davia.servers import serve_generation; serve_generation()"
+
+
+class ServerBackend(ABC):
+    """
+    Base class of the ASGI servers running the app.
+
+    Options are `log_level`, `access_log` and `log_config`, a logging dict
+    config, mapped to the settings of each server.
+    """
+
+    name: str
+
+    @abstractmethod
+    def run(
+        self,
+        app: str,
+        host: str,
+        port: int,
+        reload: bool = False,
+        fd: Optional[int] = None,
+        drain_timeout: Optional[float] = None,
+        **options: Any,
+    ):
+        """Serve the app at its import string, on the host and port or on a listening socket."""
+
+
+class UvicornServer(ServerBackend):
+    """Uvicorn, serving HTTP/1.1 and WebSockets."""
+
+    name = "uvicorn"
+
+    def run(
+        self,
+        app: str,
+        host: str,
+        port: int,
+        reload: bool = False,
+        fd: Optional[int] = None,
+        drain_timeout: Optional[float] = None,
+        **options: Any,
+    ):
+        import uvicorn
+
+        if fd is not None:
+            options["fd"] = fd
+        if drain_timeout is not None:
+            # Uvicorn takes whole seconds
+            options["timeout_graceful_shutdown"] = math.ceil(drain_timeout)
+        uvicorn.run(
+            app,
+            host=host,
+            port=port,
+            reload=reload,
+            **options,
+        )
+
+
+class HypercornServer(ServerBackend):
+    """Hypercorn, serving HTTP/1.1, HTTP/2 and WebSockets."""
+
+    name = "hypercorn"
+
+    def run(
+        self,
+        app: str,
+        host: str,
+        port: int,
+        reload: bool = False,
+        fd: Optional[int] = None,
+        drain_timeout: Optional[float] = None,
+        **options: Any,
+    ):
+        try:
+            from hypercorn.config import Config
+            from hypercorn.run import run
+        except ImportError:
+            raise ImportError(
+                'The hypercorn server requires the hypercorn extra: pip install -U "davia[hypercorn]"'
+            ) from None
+
+        config = Config()
+        config.application_path = app
+        config.bind = [f"fd://{fd}" if fd is not None else f"{host}:{port}"]
+        config.use_reloader = reload
+        config.loglevel = options.get("log_level") or "info"
+        # Access logs go to stderr like the ones of uvicorn
+        config.accesslog = "-" if options.get("access_log", True) else None
+        config.errorlog = "-"
+        if options.get("log_config") is not None:
+            config.logconfig_dict = options["log_config"]
+        if drain_timeout is not None:
+            config.graceful_timeout = drain_timeout
+        run(config)
+
+
+_backends: dict[str, type[ServerBackend]] = {
+    UvicornServer.name: UvicornServer,
+    HypercornServer.name: HypercornServer,
+}
+
+
+def get_server_backend(name: str) -> ServerBackend:
+    """Get the server backend of a name, `uvicorn` or `hypercorn`."""
+    if name not in _backends:
+        raise ValueError(
+            f"Unsupported server: {name}, expected one of {', '.join(_backends)}"
+        )
+    return _backends[name]()
+
+
+class Supervisor:
+    """
+    Keeps the listening socket of the app and runs generations of the server on it.
+
+    On SIGHUP a new generation starts on the same socket. Once its startup is
+    done, the previous generation stops accepting connections and finishes its
+    in-flight requests, so clients never see the port closed. A generation
+    failing to start is discarded and the previous one keeps serving.
+    """
+
+    def __init__(
+        self,
+        backend: ServerBackend,
+        app: str,
+        host: str,
+        port: int,
+        sys_path: Optional[list[str]] = None,
+        drain_timeout: float = DRAIN_TIMEOUT,
+        **options: Any,
+    ):
+        self.backend = backend
+        self.app = app
+        self.host = host
+        self.port = port
+        self.sys_path = sys_path or []
+        self.drain_timeout = drain_timeout
+        self.options = options
+        self.generation = 0
+        self._restart = threading.Event()
+        self._stop = threading.Event()
+
+    def run(self):
+        if os.name != "posix":
+            raise RuntimeError("Restarts without downtime are only supported on POSIX")
+
+        family = socket.AF_INET6 if ":" in self.host else socket.AF_INET
+        sock = socket.create_server((self.host, self.port), family=family)
+        sock.set_inheritable(True)
+        signal.signal(signal.SIGHUP, lambda *_: self._restart.set())
+        signal.signal(signal.SIGTERM, lambda *_: self._stop.set())
+        signal.signal(signal.SIGINT, lambda *_: self._stop.set())
+
+        current = self._start(sock)
+        if current is None:
+            raise RuntimeError("The server failed to start")
+        try:
+            while not self._stop.is_set():
+                if self._restart.wait(0.5):
+                    self._restart.clear()
+                    logger.warning("Restarting the server")
+                    new = self._start(sock)
+                    if new is None:
+                        logger.error(
+                            "The new server failed to start, keeping the previous one"
+                        )
+                        continue
+                    self._drain(current)
+                    current = new
+                elif current.poll() is not None:
+                    logger.error(
+                        "The server exited with code %s, restarting it",
+                        current.returncode,
+                    )
+                    current = self._start(sock)
+                    if current is None:
+                        raise RuntimeError("The server failed to start")
+        finally:
+            self._drain(current, wait=True)
+            sock.close()
+
+    def _start(self, sock: socket.socket) -> Optional[subprocess.Popen]:
+        """Start a generation and wait for its startup, None if it fails."""
+        self.generation += 1
+        ready_read, ready_write = os.pipe()
+        spec = {
+            "backend": self.backend.name,
+            "app": self.app,
+            "fd": sock.fileno(),
+            "sys_path": self.sys_path,
+            "drain_timeout": self.drain_timeout,
+            "options": self.options,
+        }
+        process = subprocess.Popen(
+            [sys.executable, "-c", _GENERATION_COMMAND],
+            pass_fds=(sock.fileno(), ready_write),
+            # Signals of the terminal go to the supervisor only, which drains the servers
+            start_new_session=True,
+            env={
+                **os.environ,
+                _SERVER_ENV: json.dumps(spec),
+                _READY_FD_ENV: str(ready_write),
+            },
+        )
+        os.close(ready_write)
+        try:
+            # The generation writes to the pipe once started, or closes it by exiting
+            readable, _, _ = select.select([ready_read], [], [], READY_TIMEOUT)
+            if readable and os.read(ready_read, 1):
+                logger.info("Server generation %d started", self.generation)
+                return process
+        finally:
+            os.close(ready_read)
+        self._drain(process, wait=True)
+        return None
+
+    def _drain(self, process: subprocess.Popen, wait: bool = False):
+        """Stop a generation once its in-flight requests are done."""
+        if process.poll() is not None:
+            return
+        process.terminate()
+
+        def reap():
+            try:
+                process.wait(self.drain_timeout + 5)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+
+        if wait:
+            reap()
+        else:
+            threading.Thread(target=reap, daemon=True).start()
+
+
+def notify_ready():
+    """Tell the supervisor, if any, that this generation of the server started."""
+    fd = os.environ.pop(_READY_FD_ENV, None)
+    if fd is None:
+        return
+    try:
+        os.write(int(fd), b"1")
+        os.close(int(fd))
+    except OSError:
+        logger.warning("Failed to notify the supervisor of the server startup")
+
+
+def serve(
+    server: str,
+    app: str,
+    host: str,
+    port: int,
+    reload: bool = False,
+    zero_downtime: bool = False,
+    sys_path: Optional[list[str]] = None,
+    **options: Any,
+):
+    """Serve the app with a server backend, behind a supervisor for restarts without downtime."""
+    backend = get_server_backend(server)
+    if zero_downtime:
+        Supervisor(backend, app, host, port, sys_path=sys_path, **options).run()
+    else:
+        backend.run(app, host, port, reload=reload, **options)
+
+
+def serve_generation():
+    """Serve the app described by the supervisor on the socket it passed."""
+    from davia.utils import setup_logging
+
+    setup_logging()
+    spec = json.loads(os.environ.pop(_SERVER_ENV))
+    sys.path[:0] = spec["sys_path"]
+    # The supervisor restarts on SIGHUP, not the servers
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    get_server_backend(spec["backend"]).run(
+        spec["app"],
+        host="",
+        port=0,
+        fd=spec["fd"],
+        drain_timeout=spec["drain_timeout"],
+        **spec["options"],
+    )
@@ -1,5 +1,398 @@
+import asyncio
+import copy
+import functools
+import inspect
+import json
+import os
+import threading
+import weakref
+from abc import ABC, abstractmethod
+from typing import (
+    Annotated,
+    Any,
+    Callable,
+    Generic,
+    Optional,
+    TypeVar,
+    get_args,
+    get_origin,
+)
+from urllib.parse import quote, unquote
+
+from fastapi import Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+from davia.utils import set_signature, typed_signature
+
+# Header identifying the session whose state is injected in the tasks
+SESSION_HEADER = "X-Davia-Session"
+# Response header listing the state keys changed by a task
+STATE_CHANGED_HEADER = "X-Davia-State-Changed"
+# Response header with the new values of the state keys changed by a task, as JSON
+STATE_DELTA_HEADER = "X-Davia-State-Delta"
+# Size in bytes above which the new values are not sent in the delta header
+STATE_DELTA_MAX_SIZE = 4096
+DEFAULT_SESSION = "default"
+
+# Parameters added to the task endpoints to access the request and response
+_REQUEST_PARAM = "davia_request"
+_RESPONSE_PARAM = "davia_response"
+
+
 class State:
     """A class to annotate state parameters in task functions"""
 
     def __init__(self, key: str):
         self.key = key
+
+
+T = TypeVar("T")
+
+
+class StateHandle(Generic[T]):
+    """
+    Read and write access to a state key, to replace its value.
+
+    Values injected directly are only saved when changed in place, so a
+    handle is needed to set immutable values such as numbers and strings.
+
+    ## Example
+
+    ```python
+    from davia import State, StateHandle
+
+    @app.task
+    def increment(counter: Annotated[StateHandle[int], State("counter")]) -> int:
+        counter.set(counter.value + 1)
+        return counter.value
+    ```
+    """
+
+    def __init__(self, value: T):
+        self.value = value
+
+    def set(self, value: T):
+        self.value = value
+
+
+def get_state(annotation: Any) -> Optional[State]:
+    """Get the `State` of an `Annotated[T, State("key")]` annotation, if any."""
+    if get_origin(annotation) is Annotated:
+        for metadata in get_args(annotation)[1:]:
+            if type(metadata) is State:
+                return metadata
+    return None
+
+
+class StateBackend(ABC):
+    """
+    Base class of the stores holding the state of each session.
+
+    Values are stored as JSON strings, so every task gets its own copy of the
+    state and only the keys whose serialized value changed are written back.
+    """
+
+    @abstractmethod
+    def get(self, session_id: str, key: str) -> Optional[str]: ...
+
+    @abstractmethod
+    def set_many(self, session_id: str, values: dict[str, str]) -> None: ...
+
+    @abstractmethod
+    def items(self, session_id: str) -> dict[str, str]: ...
+
+
+class InMemoryStateBackend(StateBackend):
+    """Keep the state of each session in process memory."""
+
+    def __init__(self):
+        self._sessions: dict[str, dict[str, str]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str, key: str) -> Optional[str]:
+        return self._sessions.get(session_id, {}).get(key)
+
+    def set_many(self, session_id: str, values: dict[str, str]) -> None:
+        with self._lock:
+            self._sessions.setdefault(session_id, {}).update(values)
+
+    def items(self, session_id: str) -> dict[str, str]:
+        return dict(self._sessions.get(session_id, {}))
+
+
+class DiskStateBackend(StateBackend):
+    """Keep the state of each session on local disk, one file per key."""
+
+    def __init__(self, directory: str = ".davia/state"):
+        self.directory = directory
+
+    def _path(self, session_id: str, key: Optional[str] = None) -> str:
+        path = os.path.join(self.directory, quote(session_id, safe=""))
+        if key is not None:
+            path = os.path.join(path, f"{quote(key, safe='')}.json")
+        return path
+
+    def get(self, session_id: str, key: str) -> Optional[str]:
+        try:
+            with open(self._path(session_id, key), encoding="utf-8") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def set_many(self, session_id: str, values: dict[str, str]) -> None:
+        os.makedirs(self._path(session_id), exist_ok=True)
+        for key, value in values.items():
+            path = self._path(session_id, key)
+            with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+                f.write(value)
+            os.replace(f"{path}.tmp", path)  # atomic commit
+
+    def items(self, session_id: str) -> dict[str, str]:
+        directory = self._path(session_id)
+        if not os.path.isdir(directory):
+            return {}
+        values = {}
+        for filename in os.listdir(directory):
+            if filename.endswith(".json"):
+                with open(os.path.join(directory, filename), encoding="utf-8") as f:
+                    values[unquote(filename[: -len(".json")])] = f.read()
+        return values
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(jsonable_encoder(value), sort_keys=True)
+
+
+class _StateParameter:
+    def __init__(self, name: str, key: str, annotation: Any, default: Any):
+        self.key = key
+        self.is_handle = get_origin(annotation) is StateHandle
+        if self.is_handle:
+            annotation = get_args(annotation)[0]
+        elif annotation is StateHandle:
+            annotation = Any
+        self.adapter = TypeAdapter(annotation)
+        if default is inspect.Parameter.empty:
+            default = self._empty_value(name, annotation)
+        self.default = default
+
+    def _empty_value(self, name: str, annotation: Any) -> Any:
+        """Build the value of a missing key without default from its type."""
+        try:
+            # Optional types are None
+            return self.adapter.validate_python(None)
+        except ValueError:
+            pass
+        try:
+            # Containers, numbers and strings are empty, models get their defaults
+            return self.adapter.validate_python(
+                jsonable_encoder((get_origin(annotation) or annotation)())
+            )
+        except (TypeError, ValueError):
+            raise TypeError(
+                f"State parameter '{name}' needs a default value, "
+                f"its type has no empty value"
+            ) from None
+
+    def load(self, serialized: Optional[str]) -> Any:
+        if serialized is None:
+            value = copy.deepcopy(self.default)
+        else:
+            value = self.adapter.validate_python(json.loads(serialized))
+        return StateHandle(value) if self.is_handle else value
+
+    def value(self, injected: Any) -> Any:
+        return injected.value if self.is_handle else injected
+
+
+class _KeyLocks:
+    """
+    Locks of the state keys of each session, held while a task uses them.
+
+    Tasks sharing a key run one after the other, so none of them overwrites
+    the changes of another with the value it read before. Locks are dropped
+    once no task uses them.
+    """
+
+    def __init__(self):
+        # Lock and number of tasks holding or waiting for it, by session and key
+        self._locks: dict[tuple[str, str], list] = {}
+
+    async def acquire(self, session_id: str, keys: list[str]) -> list[tuple[str, str]]:
+        # Always taken in the same order, so tasks never wait for each other
+        names = [(session_id, key) for key in sorted(set(keys))]
+        for name in names:
+            self._locks.setdefault(name, [asyncio.Lock(), 0])[1] += 1
+        acquired = 0
+        try:
+            for name in names:
+                await self._locks[name][0].acquire()
+                acquired += 1
+        except BaseException:
+            for index, name in enumerate(names):
+                self._leave(name, held=index < acquired)
+            raise
+        return names
+
+    def release(self, names: list[tuple[str, str]]):
+        for name in names:
+            self._leave(name, held=True)
+
+    def _leave(self, name: tuple[str, str], held: bool):
+        entry = self._locks[name]
+        if held:
+            entry[0].release()
+        entry[1] -= 1
+        if entry[1] == 0:
+            del self._locks[name]
+
+
+# Key locks shared by the tasks of each backend
+_backend_locks: "weakref.WeakKeyDictionary[StateBackend, _KeyLocks]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _key_locks(backend: StateBackend) -> _KeyLocks:
+    if backend not in _backend_locks:
+        _backend_locks[backend] = _KeyLocks()
+    return _backend_locks[backend]
+
+
+def _delta_header(changes: dict[str, str]) -> Optional[str]:
+    # Serialized as ASCII to be a valid header value
+    delta = json.dumps({key: json.loads(value) for key, value in changes.items()})
+    return delta if len(delta) <= STATE_DELTA_MAX_SIZE else None
+
+
+def _find_param(signature: inspect.Signature, annotation: Any) -> Optional[str]:
+    return next(
+        (
+            name
+            for name, param in signature.parameters.items()
+            if param.annotation is annotation
+        ),
+        None,
+    )
+
+
+def inject_state(func: Callable, backend: StateBackend) -> Callable:
+    """
+    Wrap a task so its `Annotated[T, State("key")]` parameters are filled from the session state.
+
+    The state parameters are removed from the route signature. Missing keys
+    get the default of their parameter, or the empty value of their type.
+    After the task returns, the keys whose value changed, in place or through
+    a `StateHandle`, are saved. They are listed in the `X-Davia-State-Changed`
+    response header and their new values are sent in the
+    `X-Davia-State-Delta` header, unless they are larger than
+    `STATE_DELTA_MAX_SIZE`, in which case clients read them from `/davia/state`.
+
+    Tasks using the same keys of a session run one at a time, so concurrent
+    calls do not lose each other's updates.
+    """
+    signature = typed_signature(func)
+
+    state_params: dict[str, _StateParameter] = {}
+    route_params = []
+    for name, param in signature.parameters.items():
+        state = get_state(param.annotation)
+        if state is None:
+            route_params.append(param)
+        else:
+            state_params[name] = _StateParameter(
+                name, state.key, get_args(param.annotation)[0], param.default
+            )
+
+    if not state_params:
+        return func
+
+    keys = [param.key for param in state_params.values()]
+    locks = _key_locks(backend)
+    # FastAPI only passes the request and the response to one parameter each,
+    # those of the task are shared with the state
+    request_param = _find_param(signature, Request)
+    response_param = _find_param(signature, Response)
+    if request_param is None:
+        route_params.append(
+            inspect.Parameter(
+                _REQUEST_PARAM, inspect.Parameter.KEYWORD_ONLY, annotation=Request
+            )
+        )
+    if response_param is None:
+        route_params.append(
+            inspect.Parameter(
+                _RESPONSE_PARAM, inspect.Parameter.KEYWORD_ONLY, annotation=Response
+            )
+        )
+    route_signature = signature.replace(
+        parameters=sorted(route_params, key=lambda p: p.kind)
+    )
+
+    def load(session_id: str, kwargs: dict) -> dict[str, str]:
+        snapshot = {}
+        for name, param in state_params.items():
+            serialized = backend.get(session_id, param.key)
+            kwargs[name] = param.load(serialized)
+            # Missing keys are compared against their default value
+            snapshot[name] = serialized or _dumps(param.value(kwargs[name]))
+        return snapshot
+
+    def commit(session_id: str, snapshot: dict, kwargs: dict, response: Response):
+        changes = {}
+        for name, param in state_params.items():
+            serialized = _dumps(param.value(kwargs[name]))
+            if serialized != snapshot[name]:
+                changes[param.key] = serialized
+        if changes:
+            backend.set_many(session_id, changes)
+            response.headers[STATE_CHANGED_HEADER] = ",".join(changes)
+            delta = _delta_header(changes)
+            if delta is not None:
+                response.headers[STATE_DELTA_HEADER] = delta
+
+    def call(session_id: str, response: Response, args: tuple, kwargs: dict):
+        snapshot = load(session_id, kwargs)
+        result = func(*args, **kwargs)
+        commit(session_id, snapshot, kwargs, response)
+        return result
+
+    def release(names: list[tuple[str, str]], work: asyncio.Future):
+        locks.release(names)
+        # Abandoned calls finish in their thread, usually with TaskCancelled
+        if not work.cancelled():
+            work.exception()
+
+    @functools.wraps(func)
+    async def endpoint(*args, **kwargs):
+        if request_param is None:
+            request: Request = kwargs.pop(_REQUEST_PARAM)
+        else:
+            request = kwargs[request_param]
+        if response_param is None:
+            response: Response = kwargs.pop(_RESPONSE_PARAM)
+        else:
+            response = kwargs[response_param]
+        session_id = request.headers.get(SESSION_HEADER, DEFAULT_SESSION)
+        names = await locks.acquire(session_id, keys)
+
+        if not inspect.iscoroutinefunction(func):
+            work = asyncio.ensure_future(
+                run_in_threadpool(call, session_id, response, args, kwargs)
+            )
+            # Abandoned calls keep the keys until their thread returns
+            work.add_done_callback(functools.partial(release, names))
+            return await asyncio.shield(work)
+
+        try:
+            snapshot = load(session_id, kwargs)
+            result = await func(*args, **kwargs)
+            commit(session_id, snapshot, kwargs, response)
+            return result
+        finally:
+            locks.release(names)
+
+    set_signature(endpoint, route_signature)
+    return endpoint
@@ -0,0 +1,707 @@
+import asyncio
+import copy
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from typing import Any, Callable, Iterable, NamedTuple, Optional, cast
+
+logger = logging.getLogger(__name__)
+
+# Seconds between two flushes of pending writes to the database
+FLUSH_INTERVAL = 1.0
+
+# Thread and run ids of a row, from its key and value
+Columns = Callable[[Any, Any], tuple[Optional[str], Optional[str]]]
+
+_MISSING = object()
+
+
+class _Changes(NamedTuple):
+    """Pending changes of a table, taken on the event loop and written from a thread."""
+
+    table: "_SqliteTable"
+    cleared: bool
+    dirty: dict
+    deleted: set
+    rows: list
+
+    def write(self, connection: sqlite3.Connection):
+        table = self.table.table
+        if self.cleared:
+            connection.execute(f"DELETE FROM {table}")
+        connection.executemany(
+            f"DELETE FROM {table} WHERE key = ?",
+            [(pickle.dumps(key),) for key in self.deleted],
+        )
+        # Upserts keep the rowid, so rows load back in insertion order
+        connection.executemany(
+            f"INSERT INTO {table} (key, thread_id, run_id, value) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET thread_id = excluded.thread_id, "
+            "run_id = excluded.run_id, value = excluded.value",
+            self.rows,
+        )
+
+
+class _SqliteTable(ABC):
+    """
+    Change tracking of a table with one row per item.
+
+    Only items written since the last sync are marked, reading an item never
+    writes it back.
+    """
+
+    def _init_table(
+        self,
+        connection: sqlite3.Connection,
+        table: str,
+        columns: Optional[Columns],
+        lock: Optional[threading.Lock],
+    ):
+        self.connection = connection
+        self.table = table
+        self.columns = columns or _no_columns
+        self.lock = lock or threading.Lock()
+        # Ordered, new rows are inserted in the order they were added
+        self._dirty: dict = {}
+        self._deleted: set = set()
+        self._cleared = False
+
+        self.connection.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} "
+            "(key BLOB PRIMARY KEY, thread_id TEXT, run_id TEXT, value BLOB NOT NULL)"
+        )
+        for column in ["thread_id", "run_id"]:
+            self.connection.execute(
+                f"CREATE INDEX IF NOT EXISTS {table}_{column} ON {table} ({column})"
+            )
+
+    def _mark(self, key):
+        self._dirty[key] = None
+        self._deleted.discard(key)
+
+    def _unmark(self, key):
+        self._dirty.pop(key, None)
+        self._deleted.add(key)
+
+    @abstractmethod
+    def _value(self, key) -> Any: ...
+
+    def _rows(self):
+        rows = self.connection.execute(
+            f"SELECT key, value FROM {self.table} ORDER BY rowid"
+        )
+        for key, value in rows:
+            yield pickle.loads(key), pickle.loads(value)
+
+    def changes(self) -> Optional[_Changes]:
+        """Take the pending changes, serializing the written items."""
+        if not (self._cleared or self._dirty or self._deleted):
+            return None
+
+        rows = []
+        for key in self._dirty:
+            value = self._value(key)
+            if value is _MISSING:
+                continue
+            rows.append(
+                (pickle.dumps(key), *self.columns(key, value), pickle.dumps(value))
+            )
+        changes = _Changes(self, self._cleared, self._dirty, self._deleted, rows)
+        self._dirty = {}
+        self._deleted = set()
+        self._cleared = False
+        return changes
+
+    def requeue(self, changes: _Changes):
+        """Mark again the changes of a failed write, unless overridden since."""
+        self._cleared = self._cleared or changes.cleared
+        for key in changes.dirty:
+            if key not in self._deleted:
+                self._dirty.setdefault(key, None)
+        self._deleted |= changes.deleted - self._dirty.keys()
+
+    def sync(self):
+        """Write pending changes to the table."""
+        changes = self.changes()
+        if changes is None:
+            return
+        try:
+            with self.lock, self.connection:
+                changes.write(self.connection)
+        except Exception:
+            self.requeue(changes)
+            raise
+
+    def close(self):
+        self.sync()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class _Levels:
+    """
+    Nested dictionaries whose deepest values are the rows of a SqliteDict.
+
+    Writes at any level mark the rows below it, keyed by their path.
+    """
+
+    _root: "SqliteDict"
+    _path: tuple
+    _depth: int
+
+    def __missing__(self, key):
+        if self._depth > 1:
+            level = _Level(self._root, self._path + (key,), self._depth - 1)
+            dict.__setitem__(self, key, level)
+            return level
+        return super().__missing__(key)
+
+    def __setitem__(self, key, value):
+        if self._depth == 1:
+            self._root._mark(self._path + (key,))
+            dict.__setitem__(self, key, value)
+            return
+        current = dict.get(self, key, _MISSING)
+        if value is current:
+            return
+        if current is not _MISSING:
+            self._forget(key, current)
+        level = _Level(self._root, self._path + (key,), self._depth - 1)
+        level.update(value)
+        dict.__setitem__(self, key, level)
+
+    def __delitem__(self, key):
+        value = dict.pop(self, key)
+        self._forget(key, value)
+
+    def pop(self, key, *default):
+        if key not in self:
+            return dict.pop(self, key, *default)
+        value = dict.__getitem__(self, key)
+        del self[key]
+        return value
+
+    def popitem(self):
+        key, value = dict.popitem(self)
+        self._forget(key, value)
+        return key, value
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return dict.__getitem__(self, key)
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def clear(self):
+        for key, value in list(dict.items(self)):
+            self._forget(key, value)
+        dict.clear(self)
+
+    def _forget(self, key, value):
+        if self._depth == 1:
+            self._root._unmark(self._path + (key,))
+        else:
+            for path in value._paths():
+                self._root._unmark(path)
+
+    def _paths(self):
+        if self._depth == 1:
+            for key in self:
+                yield self._path + (key,)
+        else:
+            for value in dict.values(self):
+                yield from value._paths()
+
+
+class _Level(_Levels, defaultdict):
+    def __init__(self, root: "SqliteDict", path: tuple, depth: int):
+        super().__init__()
+        self._root = root
+        self._path = path
+        self._depth = depth
+
+    def __reduce__(self):
+        # Copies are plain dictionaries, detached from the table
+        return (dict, (dict(self),))
+
+
+class SqliteDict(_Levels, _SqliteTable, defaultdict):
+    """
+    A defaultdict mirrored to a SQLite table.
+
+    The dictionary is kept in memory so the LangGraph runtime can use it like the
+    dictionaries it normally keeps. With a `depth` above 1 its values are nested
+    dictionaries, and each value at the deepest level is a row of the table
+    keyed by its path, so a checkpoint is a row rather than a whole thread.
+    Written rows are tracked and written in a single transaction on `sync`,
+    instead of rewriting the whole dictionary like the pickle files of the
+    in-memory runtime.
+    """
+
+    def __init__(
+        self,
+        *args: Any,
+        connection: sqlite3.Connection,
+        table: str,
+        depth: int = 1,
+        columns: Optional[Columns] = None,
+        lock: Optional[threading.Lock] = None,
+        **kwargs: Any,
+    ):
+        super().__init__(*args, **kwargs)
+        self._root = self
+        self._path = ()
+        self._depth = depth
+        self._init_table(connection, table, columns, lock)
+
+    def clear(self):
+        dict.clear(self)
+        self._dirty.clear()
+        self._deleted.clear()
+        self._cleared = True
+
+    def replace(self, other: dict):
+        """Replace the content of the dictionary, keeping track of removed keys."""
+        for key in set(self) - set(other):
+            del self[key]
+        for key, value in other.items():
+            if dict.get(self, key, _MISSING) is not value:
+                self[key] = value
+
+    def load(self):
+        """Load the dictionary content from the table."""
+        for path, value in self._rows():
+            level = self
+            for key in path[:-1]:
+                level = level[key]
+            dict.__setitem__(level, path[-1], value)
+
+    def _value(self, path: tuple) -> Any:
+        value = self
+        for key in path:
+            value = dict.get(value, key, _MISSING)
+            if value is _MISSING:
+                break
+        return value
+
+
+class _Row(dict):
+    """Item of a SqliteRows list, marking itself as written when updated."""
+
+    __slots__ = ("_rows",)
+
+    _rows: "SqliteRows"
+
+    def _changed(self):
+        self._rows._mark(self._rows.key(self))
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self._changed()
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._changed()
+
+    def pop(self, *args):
+        value = super().pop(*args)
+        self._changed()
+        return value
+
+    def popitem(self):
+        item = super().popitem()
+        self._changed()
+        return item
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        self._changed()
+
+    # mypy does not compare in-place operators with overloaded ones
+    def __ior__(self, other: Any) -> "_Row":  # type: ignore[misc]
+        self.update(other)
+        return self
+
+    def clear(self):
+        super().clear()
+        self._changed()
+
+    def __reduce__(self):
+        return (dict, (dict(self),))
+
+
+class SqliteRows(_SqliteTable, list):
+    """
+    A list of dictionaries mirrored to a SQLite table, one row per item.
+
+    Items are identified by `key`. Added items are copied into dictionaries
+    tracking their own updates, so a run changing status writes that run only.
+    """
+
+    def __init__(
+        self,
+        *,
+        connection: sqlite3.Connection,
+        table: str,
+        key: Callable[[dict], Any],
+        columns: Optional[Columns] = None,
+        lock: Optional[threading.Lock] = None,
+    ):
+        super().__init__()
+        self.key = key
+        self._items: dict[Any, _Row] = {}
+        self._init_table(connection, table, columns, lock)
+
+    def _adopt(self, item: dict) -> _Row:
+        if isinstance(item, _Row) and item._rows is self:
+            return item
+        row = _Row(item)
+        row._rows = self
+        key = self.key(row)
+        self._items[key] = row
+        self._mark(key)
+        return row
+
+    def _drop(self, row: _Row):
+        key = self.key(row)
+        if self._items.get(key) is row:
+            del self._items[key]
+            self._unmark(key)
+
+    def append(self, item):
+        super().append(self._adopt(item))
+
+    def insert(self, index, item):
+        super().insert(index, self._adopt(item))
+
+    def extend(self, items):
+        super().extend([self._adopt(item) for item in items])
+
+    # mypy does not compare in-place operators with overloaded ones
+    def __iadd__(self, items: Iterable[Any]) -> "SqliteRows":  # type: ignore[misc]
+        self.extend(items)
+        return self
+
+    def __setitem__(self, index, value):
+        removed = self[index] if isinstance(index, slice) else [self[index]]
+        if isinstance(index, slice):
+            value = [self._adopt(item) for item in value]
+            kept = {id(item) for item in value}
+        else:
+            value = self._adopt(value)
+            kept = {id(value)}
+        super().__setitem__(index, value)
+        for row in removed:
+            if id(row) not in kept:
+                self._drop(row)
+
+    def __delitem__(self, index):
+        removed = self[index] if isinstance(index, slice) else [self[index]]
+        super().__delitem__(index)
+        for row in removed:
+            self._drop(row)
+
+    def pop(self, index=-1):
+        row = super().pop(index)
+        self._drop(row)
+        return row
+
+    def remove(self, item):
+        row = self[self.index(item)]
+        super().remove(item)
+        self._drop(row)
+
+    def clear(self):
+        super().clear()
+        self._items.clear()
+        self._dirty.clear()
+        self._deleted.clear()
+        self._cleared = True
+
+    def replace(self, items: list):
+        """Replace the items, keeping track of removed ones."""
+        self[:] = items
+
+    def load(self):
+        """Load the items from the table."""
+        for key, value in self._rows():
+            row = _Row(value)
+            row._rows = self
+            self._items[key] = row
+            super().append(row)
+
+    def _value(self, key) -> Any:
+        row = self._items.get(key)
+        return _MISSING if row is None else dict(row)
+
+    def __reduce__(self):
+        return (list, (list(self),))
+
+
+# Tables of the global store: the key of their items and its columns
+_OPS_TABLES: dict[str, tuple[Callable[[dict], Any], Optional[Columns]]] = {
+    "runs": (
+        lambda run: run["run_id"],
+        lambda run_id, run: (str(run["thread_id"]), str(run_id)),
+    ),
+    "threads": (
+        lambda thread: thread["thread_id"],
+        lambda thread_id, thread: (str(thread_id), None),
+    ),
+    "assistants": (lambda assistant: assistant["assistant_id"], None),
+    "assistant_versions": (
+        lambda version: (version["assistant_id"], version["version"]),
+        None,
+    ),
+}
+
+
+class SqliteOpsStore(SqliteDict):
+    """
+    SQLite version of the runtime global store holding assistants, threads and runs.
+
+    Runs, threads, assistants and their versions each have a table with a row
+    per item, the other values of the store are rows of the `ops` table.
+    """
+
+    def __init__(
+        self,
+        *,
+        connection: sqlite3.Connection,
+        lock: Optional[threading.Lock] = None,
+    ):
+        super().__init__(connection=connection, table="ops", lock=lock)
+        self.tables: dict[str, SqliteRows] = {}
+        for name, (key, columns) in _OPS_TABLES.items():
+            rows = SqliteRows(
+                connection=connection,
+                table=name,
+                key=key,
+                columns=columns,
+                lock=self.lock,
+            )
+            rows.load()
+            self.tables[name] = rows
+            dict.__setitem__(self, name, rows)
+        self.load()
+        if not self.get("crons"):
+            self["crons"] = {}
+
+    def __setitem__(self, key, value):
+        # The runtime filters items by assigning new lists
+        if key in self.tables:
+            self.tables[key].replace(value)
+        else:
+            super().__setitem__(key, value)
+
+    def clear(self):
+        # Same behavior as the runtime global store: keep system assistants
+        for key in [key for key in self if key not in self.tables]:
+            del self[key]
+        assistants = self["assistants"]
+        for name, rows in self.tables.items():
+            rows.replace(
+                [a for a in assistants if a["metadata"].get("created_by") == "system"]
+                if name == "assistants"
+                else []
+            )
+
+
+class SqliteDatabase:
+    """
+    Local SQLite database used to persist the LangGraph runtime data.
+
+    The database runs in WAL mode so reads are not blocked by the batched writes.
+    """
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        # Writes happen from a worker thread, one transaction at a time
+        self.lock = threading.Lock()
+        self.tables: list[_SqliteTable] = []
+
+    def dict(
+        self,
+        table: str,
+        *args: Any,
+        depth: int = 1,
+        columns: Optional[Columns] = None,
+    ) -> SqliteDict:
+        """Create a dictionary mirrored to `table` and load its content."""
+        d = SqliteDict(
+            *args,
+            connection=self.connection,
+            table=table,
+            depth=depth,
+            columns=columns,
+            lock=self.lock,
+        )
+        d.load()
+        self.tables.append(d)
+        return d
+
+    def ops_store(self) -> SqliteOpsStore:
+        """Create the store holding assistants, threads and runs."""
+        store = SqliteOpsStore(connection=self.connection, lock=self.lock)
+        self.tables += [store, *store.tables.values()]
+        return store
+
+    def changes(self) -> list[_Changes]:
+        """Take the pending changes of all tables."""
+        return [
+            changes
+            for changes in (table.changes() for table in self.tables)
+            if changes is not None
+        ]
+
+    def write(self, changes: list[_Changes]):
+        """Write changes taken with `changes` in a single transaction."""
+        with self.lock, self.connection:
+            for table_changes in changes:
+                table_changes.write(self.connection)
+
+    def sync(self):
+        """Write pending changes of all tables."""
+        changes = self.changes()
+        if not changes:
+            return
+        try:
+            self.write(changes)
+        except Exception:
+            for table_changes in changes:
+                table_changes.table.requeue(table_changes)
+            raise
+
+    async def flush_loop(self, interval: float = FLUSH_INTERVAL):
+        """
+        Periodically write pending changes, batching the writes of each interval.
+
+        Changes are taken on the event loop, where the runtime updates the data,
+        and written from a worker thread.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            changes = self.changes()
+            if not changes:
+                continue
+            try:
+                await asyncio.to_thread(self.write, changes)
+            except Exception:
+                for table_changes in changes:
+                    table_changes.table.requeue(table_changes)
+                logger.exception("Failed to write to the database, retrying")
+
+    def close(self):
+        self.sync()
+        self.connection.close()
+
+
+def _no_columns(key: Any, value: Any) -> tuple[Optional[str], Optional[str]]:
+    return None, None
+
+
+def _thread_column(path: tuple, value: Any) -> tuple[Optional[str], Optional[str]]:
+    # Writes and blobs are keyed by tuples starting with the thread id
+    return str(path[0][0]), None
+
+
+def install(path: str) -> SqliteDatabase:
+    """
+    Replace the storage of the in-memory LangGraph runtime with a SQLite database.
+
+    Must be called before the runtime server is imported.
+    """
+    from langgraph.checkpoint.memory import MemorySaver
+    from langgraph_api import stream
+    from langgraph_api.serde import Serializer
+    from langgraph_storage import checkpoint, database, ops
+
+    class SqliteSaver(checkpoint.InMemorySaver):
+        """Checkpointer of the runtime, with its storage mirrored to SQLite."""
+
+        def __init__(self, db: SqliteDatabase):
+            def checkpoint_columns(path, value):
+                # Rows are (checkpoint, metadata, parent id) under (thread, ns, id)
+                metadata = self.serde.loads_typed(value[1])
+                run_id = metadata.get("run_id")
+                return str(path[0]), str(run_id) if run_id else None
+
+            # Checkpoints by thread and namespace, writes by checkpoint, blobs
+            tables = iter(
+                [
+                    ("checkpoints", 3, checkpoint_columns),
+                    ("writes", 2, _thread_column),
+                    ("blobs", 1, _thread_column),
+                ]
+            )
+
+            def factory(*args):
+                table, depth, columns = next(tables)
+                return db.dict(table, *args, depth=depth, columns=columns)
+
+            # Any callable returning a dictionary works as the factory
+            MemorySaver.__init__(
+                self, serde=Serializer(), factory=cast(type[defaultdict], factory)
+            )
+
+        @property
+        def writes(self):
+            return self._writes
+
+        @writes.setter
+        def writes(self, value):
+            # The runtime replaces the writes dictionary when deleting a thread
+            if isinstance(value, SqliteDict):
+                self._writes = value
+            else:
+                self._writes.replace(value)
+
+        def clear(self):
+            self.storage.clear()
+            self.writes.clear()
+            self.blobs.clear()
+
+    db = SqliteDatabase(path)
+    saver = SqliteSaver(db)
+
+    def Checkpointer(*args, unpack_hook=None, **kwargs):
+        if unpack_hook is not None:
+            # Same storage, different deserialization
+            view = copy.copy(saver)
+            view.serde = Serializer(__unpack_ext_hook__=unpack_hook)
+            return view
+        return saver
+
+    checkpoint.MEMORY = saver
+    checkpoint.Checkpointer = Checkpointer
+    ops.Checkpointer = Checkpointer
+    stream.Checkpointer = Checkpointer
+    database.GLOBAL_STORE = db.ops_store()
+
+    return db
@@ -0,0 +1,127 @@
+import json
+import uuid
+from collections import OrderedDict, deque
+from typing import Any, Optional
+
+# Number of patches kept per thread to answer clients that are behind
+MAX_HISTORY = 64
+# Every RESYNC_EVERY versions, a full snapshot is sent instead of a patch
+RESYNC_EVERY = 50
+# Number of threads whose state is tracked
+MAX_THREADS = 1024
+
+
+def _escape(key: Any) -> str:
+    return str(key).replace("~", "~0").replace("/", "~1")
+
+
+def make_patch(old: Any, new: Any, path: str = "") -> list[dict]:
+    """
+    Compute a JSON Patch (RFC 6902) turning `old` into `new`.
+
+    Lists that only grew, such as message histories, are patched by appending
+    the new items, so the patch size follows the change rather than the state.
+    """
+    if old == new:
+        return []
+    if isinstance(old, dict) and isinstance(new, dict):
+        patch = []
+        for key in old:
+            if key not in new:
+                patch.append({"op": "remove", "path": f"{path}/{_escape(key)}"})
+        for key, value in new.items():
+            key_path = f"{path}/{_escape(key)}"
+            if key not in old:
+                patch.append({"op": "add", "path": key_path, "value": value})
+            else:
+                patch.extend(make_patch(old[key], value, key_path))
+        return patch
+    if isinstance(old, list) and isinstance(new, list):
+        patch = []
+        common = min(len(old), len(new))
+        for index in range(common):
+            patch.extend(make_patch(old[index], new[index], f"{path}/{index}"))
+        # Remove from the end so the indexes stay valid
+        for index in range(len(old) - 1, common - 1, -1):
+            patch.append({"op": "remove", "path": f"{path}/{index}"})
+        for value in new[common:]:
+            patch.append({"op": "add", "path": f"{path}/-", "value": value})
+        return patch
+    return [{"op": "replace", "path": path, "value": new}]
+
+
+class StateSync:
+    """
+    Versioned state of a thread, able to answer with a patch from any recent version.
+
+    Versions are sent to clients as `<epoch>.<number>` tokens. The epoch is
+    new for each instance, so a client holding a version from before a
+    restart or an eviction of the thread gets a snapshot, not an empty patch.
+    """
+
+    def __init__(self):
+        self.epoch = uuid.uuid4().hex[:12]
+        self.version = 0
+        self.values: Any = None
+        self.history: deque[tuple[int, list[dict]]] = deque(maxlen=MAX_HISTORY)
+
+    def update(self, values: Any) -> Optional[list[dict]]:
+        """Record new values, returning the patch from the previous version if they changed."""
+        # Normalize to plain JSON values so patches compare what clients receive
+        values = json.loads(json.dumps(values, default=str))
+        if self.version and values == self.values:
+            return None
+        patch = make_patch(self.values, values) if self.version else None
+        self.version += 1
+        self.values = values
+        if patch is None or self.version % RESYNC_EVERY == 0:
+            # Clients have to resync from a snapshot
+            self.history.clear()
+        else:
+            self.history.append((self.version, patch))
+        return patch
+
+    @property
+    def token(self) -> str:
+        return f"{self.epoch}.{self.version}"
+
+    def _parse(self, token: Optional[str]) -> Optional[int]:
+        """Get the version number of a token of this instance, None otherwise."""
+        epoch, _, number = (token or "").partition(".")
+        if epoch != self.epoch or not number.isdigit():
+            return None
+        return int(number)
+
+    def delta(self, token: Optional[str]) -> dict:
+        """Get the changes since the version of `token`, or a snapshot if it is too old."""
+        since = self._parse(token)
+        if since == self.version:
+            return {"version": self.token, "patch": []}
+        if (
+            since
+            and since < self.version
+            and self.history
+            and self.history[0][0] <= since + 1
+        ):
+            patch = [
+                op for version, ops in self.history if version > since for op in ops
+            ]
+            return {"version": self.token, "patch": patch}
+        return {"version": self.token, "values": self.values}
+
+
+class StateSyncRegistry:
+    """Least recently used registry of the state of each thread."""
+
+    def __init__(self, max_threads: int = MAX_THREADS):
+        self.max_threads = max_threads
+        self._threads: OrderedDict[str, StateSync] = OrderedDict()
+
+    def get(self, thread_id: str) -> StateSync:
+        if thread_id in self._threads:
+            self._threads.move_to_end(thread_id)
+        else:
+            self._threads[thread_id] = StateSync()
+            if len(self._threads) > self.max_threads:
+                self._threads.popitem(last=False)
+        return self._threads[thread_id]
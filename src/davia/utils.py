@@ -1,4 +1,6 @@
+import inspect
 import logging
+from typing import Any, Callable, cast, get_type_hints
 
 
 class EndpointFilter(logging.Filter):
@@ -15,3 +17,21 @@ def setup_logging():
     uvicorn_logger = logging.getLogger("uvicorn.access")
     endpoint_filter = EndpointFilter(["/openapi.json", "/davia/graph-schemas"])
     uvicorn_logger.addFilter(endpoint_filter)
+
+
+def typed_signature(func: Callable) -> inspect.Signature:
+    """Get the signature of a function with its string annotations resolved."""
+    signature = inspect.signature(func)
+    hints = get_type_hints(func, include_extras=True)
+    return signature.replace(
+        parameters=[
+            param.replace(annotation=hints.get(name, param.annotation))
+            for name, param in signature.parameters.items()
+        ],
+        return_annotation=hints.get("return", signature.return_annotation),
+    )
+
+
+def set_signature(func: Callable, signature: inspect.Signature):
+    """Set the signature FastAPI reads for the parameters of a wrapped endpoint."""
+    cast(Any, func).__signature__ = signature
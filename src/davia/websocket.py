@@ -0,0 +1,172 @@
+import asyncio
+import json
+import logging
+from typing import Any, Optional
+
+from fastapi import WebSocket, WebSocketDisconnect
+from fastapi.routing import APIRoute
+
+from davia.calls import call_task, find_task_route
+
+logger = logging.getLogger(__name__)
+
+# Calls in flight on a connection, the next ones are rejected with a 429
+MAX_IN_FLIGHT = 256
+# Headers of the WebSocket handshake not passed on to the tasks
+_HANDSHAKE_HEADERS = {
+    b"connection",
+    b"upgrade",
+    b"content-length",
+    b"content-type",
+    b"sec-websocket-key",
+    b"sec-websocket-version",
+    b"sec-websocket-extensions",
+    b"sec-websocket-protocol",
+}
+
+
+class TaskSocket:
+    """
+    WebSocket connection multiplexing task calls.
+
+    Clients send `{"id": ..., "task": ..., "args": {...}, "timeout": ...}`
+    to call a task and `{"id": ..., "cancel": true}` to cancel a call. Each
+    call is answered with `{"id": ..., "status": ..., "result": ...}`, after
+    `{"id": ..., "partial": ...}` messages if the task streams its response.
+    The server pushes `{"event": ..., "data": ...}` messages at any time.
+    Call ids are strings or integers, binary frames and invalid messages are
+    answered with an `error` event.
+
+    Calls run the route handler of the task, so they are validated, admitted
+    and serialized as over HTTP, without the middlewares and the routing.
+    Like HTTP requests, calls to sync tasks can only be cancelled when they
+    have a timeout or take a cancellation token.
+    """
+
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self.app = websocket.scope["app"]
+        self._send_lock = asyncio.Lock()
+        self._calls: dict[Any, asyncio.Event] = {}
+        self._closed = False
+        self._headers = [
+            (name, value)
+            for name, value in websocket.scope["headers"]
+            if name not in _HANDSHAKE_HEADERS
+        ]
+
+    async def send(self, message: str):
+        async with self._send_lock:
+            await self.websocket.send_text(message)
+
+    async def push(self, event: str, data: Any):
+        """Push an event to the client."""
+        await self.send(json.dumps({"event": event, "data": data}, default=str))
+
+    async def serve(self):
+        await self.websocket.accept()
+        self.app._task_sockets.add(self)
+        tasks = set()
+        try:
+            while True:
+                message = await self.websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                if message.get("text") is None:
+                    await self.push(
+                        "error", {"detail": "Only text frames are supported"}
+                    )
+                    continue
+                call = _parse_call(message["text"])
+                if call is None:
+                    await self.push("error", {"detail": "Invalid message"})
+                    continue
+                call_id = call["id"]
+
+                if call.get("cancel"):
+                    if call_id in self._calls:
+                        self._calls[call_id].set()
+                    continue
+                if len(self._calls) >= MAX_IN_FLIGHT or call_id in self._calls:
+                    detail = (
+                        "Too many calls in flight"
+                        if call_id not in self._calls
+                        else "Duplicate call id"
+                    )
+                    await self._answer(call_id, 429, json.dumps({"detail": detail}))
+                    continue
+
+                self._calls[call_id] = asyncio.Event()
+                task = asyncio.ensure_future(self._call(call_id, call))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except WebSocketDisconnect:
+            pass
+        finally:
+            self._closed = True
+            self.app._task_sockets.discard(self)
+            # Calls see the disconnection as the one of an HTTP client
+            for cancelled in self._calls.values():
+                cancelled.set()
+
+    async def _answer(self, call_id: Any, status: int, result: str):
+        await self.send(
+            f'{{"id": {json.dumps(call_id)}, "status": {status}, "result": {result}}}'
+        )
+
+    async def _call(self, call_id: Any, call: dict):
+        try:
+            route = find_task_route(self.app, call.get("task"))
+            if route is None:
+                detail = {"detail": f"Task '{call.get('task')}' not found"}
+                await self._answer(call_id, 404, json.dumps(detail))
+                return
+            await self._run(call_id, call, route)
+        except WebSocketDisconnect:
+            pass
+        except Exception:
+            logger.exception("Task call %r failed", call_id)
+            if not self._closed:
+                await self._answer(
+                    call_id, 500, json.dumps({"detail": "Internal Server Error"})
+                )
+        finally:
+            self._calls.pop(call_id, None)
+
+    async def _run(self, call_id: Any, call: dict, route: APIRoute):
+        scope = {
+            **self.websocket.scope,
+            "scheme": "https"
+            if self.websocket.scope.get("scheme") == "wss"
+            else "http",
+        }
+        scope.pop("subprotocols", None)
+
+        async def on_partial(partial: str):
+            await self.send(json.dumps({"id": call_id, "partial": partial}))
+
+        status, result = await call_task(
+            route,
+            scope,
+            call.get("args") or {},
+            self._headers,
+            self._calls[call_id],
+            timeout=call.get("timeout"),
+            on_partial=on_partial,
+        )
+        if not self._closed:
+            await self._answer(call_id, status, result)
+
+
+def _parse_call(message: str) -> Optional[dict]:
+    """Parse a call message, None unless it is an object with a string or integer id."""
+    try:
+        call = json.loads(message)
+    except ValueError:
+        return None
+    if not isinstance(call, dict):
+        return None
+    call_id = call.get("id")
+    if isinstance(call_id, bool) or not isinstance(call_id, (str, int)):
+        return None
+    return call
@@ -0,0 +1,35 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from davia import Admission, Davia
+from davia.admission import AdmissionController, Overloaded
+
+
+def test_rate_limited_task_answers_429():
+    app = Davia()
+
+    @app.task(admission=Admission(rate=0.1, burst=1))
+    def limited() -> str:
+        return "ok"
+
+    client = TestClient(app)
+
+    assert client.post("/limited").status_code == 200
+    response = client.post("/limited")
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+
+
+def test_full_queue_answers_503():
+    async def main():
+        controller = AdmissionController(Admission(max_concurrency=1, max_queued=0))
+        await controller.acquire()
+        with pytest.raises(Overloaded) as overloaded:
+            await controller.acquire()
+        assert overloaded.value.status_code == 503
+        controller.release(0.01)
+        await controller.acquire()
+
+    asyncio.run(main())
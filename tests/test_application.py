@@ -0,0 +1,51 @@
+from fastapi.testclient import TestClient
+
+from davia import Davia
+
+
+class CustomDavia(Davia):
+    def __init__(self):
+        super().__init__(title="Custom")
+
+
+def create_app() -> Davia:
+    return CustomDavia()
+
+
+def make_app(factor: int) -> Davia:
+    app = Davia()
+
+    @app.task
+    def scale(value: int) -> int:
+        return value * factor
+
+    return app
+
+
+def test_source_globals_are_the_creating_module():
+    assert create_app()._source_globals is globals()
+    assert Davia()._source_globals is globals()
+
+
+def test_reload_swaps_task_routes():
+    app = make_app(2)
+    client = TestClient(app)
+    assert client.post("/scale", params={"value": 3}).json() == 6
+
+    assert app._reload_from(make_app(3)) is False
+    assert client.post("/scale", params={"value": 3}).json() == 9
+    assert [route.path for route in app.routes].count("/scale") == 1
+
+
+def test_runtime_tasks_bump_the_version():
+    app = make_app(2)
+    client = TestClient(app)
+    assert "/late" not in client.get("/openapi.json").json()["paths"]
+    version = app._changes.version
+
+    @app.task
+    def late() -> str:
+        return "late"
+
+    assert app._changes.version > version
+    assert "/late" in client.get("/openapi.json").json()["paths"]
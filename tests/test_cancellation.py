@@ -0,0 +1,104 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+
+from davia import CancellationToken, Davia
+from davia.cancellation import TIMEOUT_HEADER
+
+
+def make_app() -> Davia:
+    app = Davia()
+
+    @app.task(timeout=0.05)
+    async def slow() -> str:
+        await asyncio.sleep(5)
+        return "done"
+
+    @app.task
+    async def wait(seconds: float) -> float:
+        await asyncio.sleep(seconds)
+        return seconds
+
+    @app.task(timeout=0.05)
+    def crunch(token: CancellationToken) -> bool:
+        token._event.wait(5)
+        return token.cancelled
+
+    return app
+
+
+def test_deadline_exceeded():
+    client = TestClient(make_app())
+
+    response = client.post("/slow")
+
+    assert response.status_code == 504
+    assert response.json() == {"detail": "Task deadline exceeded"}
+
+
+def test_client_timeout_header():
+    client = TestClient(make_app())
+
+    assert client.post("/wait?seconds=0.01").json() == 0.01
+    response = client.post("/wait?seconds=5", headers={TIMEOUT_HEADER: "0.05"})
+    assert response.status_code == 504
+
+    response = client.post("/wait?seconds=0", headers={TIMEOUT_HEADER: "soon"})
+    assert response.status_code == 400
+
+
+def test_sync_task_sees_its_token_cancelled():
+    client = TestClient(make_app())
+
+    response = client.post("/crunch")
+
+    assert response.status_code == 504
+
+
+def test_async_task_is_cancelled_on_disconnect():
+    app = Davia()
+    cancelled = []
+
+    @app.task
+    async def forever() -> str:
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+        return "done"
+
+    async def main():
+        messages = [{"type": "http.request", "body": b"", "more_body": False}]
+        sent = []
+
+        async def receive():
+            if messages:
+                return messages.pop()
+            await asyncio.sleep(0.05)
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "POST",
+            "scheme": "http",
+            "path": "/forever",
+            "raw_path": b"/forever",
+            "query_string": b"",
+            "root_path": "",
+            "headers": [],
+            "client": ("test", 1),
+            "server": ("test", 80),
+        }
+        await asyncio.wait_for(app(scope, receive, send), 2)
+        return sent
+
+    sent = asyncio.run(main())
+
+    assert cancelled == [True]
+    assert sent[0]["status"] == 499
@@ -0,0 +1,27 @@
+import asyncio
+import threading
+import time
+
+from davia.events import ChangeNotifier
+
+
+def test_bumps_from_other_threads_wake_the_waiters():
+    changes = ChangeNotifier()
+    version = changes.version
+
+    def bump_later():
+        time.sleep(0.1)
+        changes.bump()
+
+    async def main():
+        thread = threading.Thread(target=bump_later)
+        thread.start()
+        started = time.monotonic()
+        latest = await changes.wait(version, timeout=2)
+        thread.join()
+        return latest, time.monotonic() - started
+
+    latest, elapsed = asyncio.run(main())
+    assert latest == version + 1
+    assert elapsed < 1
+    assert changes.version == version + 1
@@ -0,0 +1,169 @@
+import asyncio
+import pickle
+import threading
+
+import pytest
+from langgraph.checkpoint.memory import InMemorySaver
+
+from davia.graphs import GraphRegistry, scan_graphs
+from davia.routers import get_function_from_path
+
+
+def test_scan_graphs_only_matches_davia(tmp_path):
+    (tmp_path / "agents.py").write_text(
+        '''
+import davia as dv
+from davia import graph as mark
+from other import graph
+from main import app
+
+local = dv.Davia()
+
+
+@mark
+def marked():
+    """Marked graph."""
+
+
+@dv.graph
+async def from_module():
+    pass
+
+
+@local.graph
+def from_local_app():
+    pass
+
+
+@app.graph
+def from_imported_app():
+    pass
+
+
+@graph
+def other_graph():
+    pass
+
+
+@router.graph
+def other_method():
+    pass
+'''
+    )
+    (tmp_path / "__pycache__").mkdir()
+    (tmp_path / "__pycache__" / "stale.py").write_text(
+        "from davia import graph\n@graph\ndef stale(): pass\n"
+    )
+
+    graphs = scan_graphs(tmp_path, app_names=["app"])
+
+    assert sorted(graphs) == [
+        "from_imported_app",
+        "from_local_app",
+        "from_module",
+        "marked",
+    ]
+    assert graphs["marked"]["docstring"] == "Marked graph."
+    assert graphs["from_module"]["docstring"] is None
+    assert "from_imported_app" not in scan_graphs(tmp_path)
+
+
+def test_scan_graphs_rejects_duplicate_names(tmp_path):
+    source = "from davia import graph\n@graph\ndef agent(): pass\n"
+    (tmp_path / "a.py").write_text(source)
+    (tmp_path / "b.py").write_text(source)
+
+    with pytest.raises(ValueError, match="Graph 'agent' is defined in both"):
+        scan_graphs(tmp_path)
+
+
+def test_graph_state_classes_can_be_checkpointed(tmp_path):
+    (tmp_path / "agent.py").write_text(
+        """
+from dataclasses import dataclass
+from typing import TypedDict
+
+from langgraph.graph import END, START, StateGraph
+
+
+@dataclass
+class Item:
+    name: str
+
+
+class State(TypedDict):
+    items: list[Item]
+
+
+def respond(state: State) -> dict:
+    return {"items": state["items"] + [Item("ok")]}
+
+
+def agent():
+    graph = StateGraph(State)
+    graph.add_node("respond", respond)
+    graph.add_edge(START, "respond")
+    graph.add_edge("respond", END)
+    return graph
+"""
+    )
+    builder = get_function_from_path(f"{tmp_path / 'agent.py'}:agent")
+    graph = builder().compile(checkpointer=InMemorySaver())
+    config = {"configurable": {"thread_id": "thread"}}
+
+    graph.invoke({"items": []}, config)
+
+    (item,) = graph.get_state(config).values["items"]
+    assert type(item).__name__ == "Item"
+    # The runtime pickles its checkpoints to persist them
+    assert pickle.loads(pickle.dumps(item)) == item
+
+
+def test_graph_factories_import_modules_off_the_event_loop(tmp_path):
+    (tmp_path / "agents.py").write_text(
+        """
+import threading
+from contextlib import asynccontextmanager
+from typing import TypedDict
+
+from langgraph.graph import END, START, StateGraph
+
+imported_in = threading.current_thread()
+
+
+class State(TypedDict):
+    count: int
+
+
+def step(state: State) -> dict:
+    return {"count": state["count"] + 1}
+
+
+def counter():
+    graph = StateGraph(State)
+    graph.add_node("step", step)
+    graph.add_edge(START, "step")
+    graph.add_edge("step", END)
+    return graph
+
+
+@asynccontextmanager
+async def configured(config):
+    yield counter().compile(name=config["name"])
+"""
+    )
+    registry = GraphRegistry()
+    source_file = str(tmp_path / "agents.py")
+
+    async def main():
+        async with registry.factory("counter", source_file)({}) as counter:
+            count = (await counter.ainvoke({"count": 0}))["count"]
+        async with registry.factory("configured", source_file)(
+            {"name": "named"}
+        ) as configured:
+            name = configured.name
+        return count, name
+
+    assert asyncio.run(main()) == (1, "named")
+    module_globals = get_function_from_path(f"{source_file}:counter").__globals__
+    assert module_globals["imported_in"] is not threading.main_thread()
@@ -0,0 +1,108 @@
+import asyncio
+import time
+
+from fastapi.testclient import TestClient
+
+from davia import Davia
+from davia.jobs import InMemoryBroker, JobWorker
+
+
+def make_app() -> Davia:
+    app = Davia()
+
+    @app.task
+    def double(value: int) -> int:
+        return value * 2
+
+    return app
+
+
+def test_in_memory_broker_takes_one_job_per_queue():
+    async def main():
+        broker = InMemoryBroker()
+        for i in range(2):
+            await broker.enqueue("task:a", {"job_id": f"a{i}"})
+        await broker.enqueue("task:b", {"job_id": "b0"})
+
+        jobs = await broker.dequeue(["task:a", "task:b"], "worker", timeout=0)
+        assert [job["job_id"] for _, _, job in jobs] == ["a0", "b0"]
+        jobs = await broker.dequeue(["task:a", "task:b"], "worker", timeout=0)
+        assert [job["job_id"] for _, _, job in jobs] == ["a1"]
+
+    asyncio.run(main())
+
+
+def test_in_memory_broker_redelivers_unacknowledged_jobs():
+    async def main():
+        broker = InMemoryBroker(visibility_timeout=0.05)
+        await broker.enqueue("task:a", {"job_id": "lost"})
+        await broker.enqueue("task:b", {"job_id": "done"})
+        for queue, entry_id, job in await broker.dequeue(
+            ["task:a", "task:b"], "worker", timeout=0
+        ):
+            if job["job_id"] == "done":
+                await broker.ack(queue, entry_id)
+
+        assert await broker.dequeue(["task:a", "task:b"], "worker", timeout=0) == []
+        await asyncio.sleep(0.05)
+        jobs = await broker.dequeue(["task:a", "task:b"], "worker", timeout=0)
+        assert [job["job_id"] for _, _, job in jobs] == ["lost"]
+
+    asyncio.run(main())
+
+
+def test_jobs_are_disabled_without_a_broker():
+    client = TestClient(make_app())
+
+    response = client.post("/davia/jobs/tasks/double", json={"value": 2})
+
+    assert response.status_code == 503
+
+
+def test_worker_runs_task_jobs(monkeypatch):
+    monkeypatch.setenv("DAVIA_BROKER_URL", "memory://")
+
+    with TestClient(make_app()) as client:
+        job = client.post("/davia/jobs/tasks/double", json={"value": 21}).json()
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            status = client.get(f"/davia/jobs/{job['job_id']}").json()
+            if status["status"] == "done":
+                break
+            time.sleep(0.02)
+
+    assert status["status_code"] == 200
+    assert status["result"] == 42
+
+
+def test_long_jobs_are_kept_while_they_run():
+    app = Davia()
+    runs = []
+
+    @app.task
+    async def long_job() -> int:
+        runs.append(1)
+        # Longer than the wait of the worker for new jobs, which reclaims them
+        await asyncio.sleep(1.2)
+        return len(runs)
+
+    async def main():
+        broker = InMemoryBroker(visibility_timeout=0.1)
+        worker = JobWorker(app, broker)
+        await broker.enqueue(
+            "task:long_job", {"job_id": "j", "kind": "task", "task": "long_job"}
+        )
+        running = asyncio.ensure_future(worker.run())
+        try:
+            for _ in range(200):
+                status = await broker.get_status("j")
+                if status and status["status"] == "done":
+                    return status
+                await asyncio.sleep(0.02)
+        finally:
+            running.cancel()
+
+    status = asyncio.run(main())
+
+    assert status["result"] == 1
+    assert runs == [1]
@@ -0,0 +1,25 @@
+import importlib
+import os
+import sys
+
+from davia.reload import HotReloader
+
+
+def test_from_imports_are_reloaded_with_their_module(tmp_path, monkeypatch):
+    (tmp_path / "app.py").write_text("from davia import Davia\napp = Davia()\n")
+    (tmp_path / "helper.py").write_text("CONSTANT = 1\n")
+    (tmp_path / "user.py").write_text("from helper import CONSTANT\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    # Sources are read again even when changed within the same second
+    monkeypatch.setattr(sys, "dont_write_bytecode", True)
+    user = importlib.import_module("user")
+    for name in ["helper", "user"]:
+        monkeypatch.setitem(sys.modules, name, sys.modules[name])
+    app_file = str(tmp_path / "app.py")
+    namespace = {"__file__": app_file, "__name__": "app"}
+    exec(compile((tmp_path / "app.py").read_text(), app_file, "exec"), namespace)
+
+    (tmp_path / "helper.py").write_text("CONSTANT = 2\n")
+    HotReloader(namespace["app"]).reload({os.path.realpath(tmp_path / "helper.py")})
+
+    assert user.CONSTANT == 2
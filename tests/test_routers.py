@@ -0,0 +1,74 @@
+import asyncio
+import json
+
+import httpx
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from davia import routers
+from davia.routers import _latest_assistants
+
+
+def test_latest_assistants_are_searched_per_graph(monkeypatch):
+    monkeypatch.setattr(routers, "ASSISTANTS_PAGE_SIZE", 2)
+    # Newest created first, like the store sorts them
+    assistants = [
+        {"assistant_id": f"{graph_id}-{i}", "graph_id": graph_id, "updated_at": updated}
+        for graph_id in ["a", "b", "other"]
+        for i, updated in enumerate(["2026-01-02", "2026-01-03", "2026-01-01"])
+    ]
+    searches = []
+
+    def search(request: httpx.Request) -> httpx.Response:
+        query = json.loads(request.content)
+        searches.append(query)
+        found = [a for a in assistants if a["graph_id"] == query.get("graph_id")]
+        page = found[query["offset"] : query["offset"] + query["limit"]]
+        return httpx.Response(200, json=page)
+
+    async def main():
+        transport = httpx.MockTransport(search)
+        async with httpx.AsyncClient(transport=transport) as client:
+            return await _latest_assistants(client, "http://runtime", ["a", "b", "c"])
+
+    latest = asyncio.run(main())
+
+    assert {graph_id: a["assistant_id"] for graph_id, a in latest.items()} == {
+        "a": "a-1",
+        "b": "b-1",
+    }
+    assert {search["graph_id"] for search in searches} == {"a", "b", "c"}
+
+
+def test_graph_schemas_include_the_state_of_every_graph(monkeypatch):
+    monkeypatch.setenv("LANGSERVE_GRAPHS", json.dumps({"a": "a.py:a", "b": "b.py:b"}))
+    monkeypatch.setenv("DAVIA_GRAPHS", "{}")
+    schema_requests = []
+
+    def runtime(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/assistants/search":
+            graph_id = json.loads(request.content)["graph_id"]
+            return httpx.Response(
+                200,
+                json=[{"assistant_id": graph_id, "updated_at": "2026-01-01"}],
+            )
+        schema_requests.append(request.url.path)
+        return httpx.Response(200, json={"state_schema": {"title": "State"}})
+
+    transport = httpx.MockTransport(runtime)
+    async_client = httpx.AsyncClient
+    monkeypatch.setattr(httpx, "AsyncClient", lambda: async_client(transport=transport))
+    app = FastAPI()
+    app.include_router(routers.router)
+    client = TestClient(app)
+
+    schemas = client.get("/davia/graph-schemas").json()
+    assert [schema["user_state_snapshot"] for schema in schemas] == [
+        {"title": "State"},
+        {"title": "State"},
+    ]
+
+    schema_requests.clear()
+    schemas = client.get("/davia/graph-schemas", params={"fields": "name"}).json()
+    assert schemas == [{"name": "a"}, {"name": "b"}]
+    assert schema_requests == []
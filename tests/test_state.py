@@ -0,0 +1,169 @@
+import asyncio
+import json
+from typing import Annotated, Optional
+
+import httpx
+import pytest
+from fastapi import Request
+from fastapi.testclient import TestClient
+from pydantic import BaseModel
+
+from davia import Davia, DiskStateBackend, State, StateHandle
+from davia.state import (
+    SESSION_HEADER,
+    STATE_CHANGED_HEADER,
+    STATE_DELTA_HEADER,
+    STATE_DELTA_MAX_SIZE,
+)
+
+
+class Settings(BaseModel):
+    theme: str = "light"
+
+
+def make_app(**kwargs) -> Davia:
+    app = Davia(**kwargs)
+
+    @app.task
+    def add_item(item: str, items: Annotated[list[str], State("items")]) -> int:
+        items.append(item)
+        return len(items)
+
+    @app.task
+    def increment(counter: Annotated[StateHandle[int], State("counter")]) -> int:
+        counter.set(counter.value + 1)
+        return counter.value
+
+    @app.task
+    def theme(settings: Annotated[Settings, State("settings")]) -> str:
+        return settings.theme
+
+    @app.task
+    def last(value: Annotated[Optional[str], State("last")]) -> Optional[str]:
+        return value
+
+    return app
+
+
+def test_missing_values_are_built_from_the_annotation():
+    client = TestClient(make_app())
+
+    assert client.post("/add_item", params={"item": "a"}).json() == 1
+    assert client.post("/theme").json() == "light"
+    assert client.post("/last").json() is None
+
+
+def test_state_persists_per_session():
+    client = TestClient(make_app())
+
+    client.post("/add_item", params={"item": "a"})
+    client.post("/add_item", params={"item": "b"})
+    other = client.post(
+        "/add_item", params={"item": "c"}, headers={SESSION_HEADER: "other"}
+    )
+
+    assert other.json() == 1
+    assert client.get("/davia/state").json() == {"items": ["a", "b"]}
+
+
+def test_handle_sets_immutable_values():
+    client = TestClient(make_app())
+
+    client.post("/increment")
+    response = client.post("/increment")
+
+    assert response.json() == 2
+    assert response.headers[STATE_CHANGED_HEADER] == "counter"
+    assert json.loads(response.headers[STATE_DELTA_HEADER]) == {"counter": 2}
+
+
+def test_unchanged_state_is_not_reported():
+    client = TestClient(make_app())
+
+    response = client.post("/theme")
+
+    assert STATE_CHANGED_HEADER not in response.headers
+    assert STATE_DELTA_HEADER not in response.headers
+
+
+def test_state_parameters_are_hidden_from_the_route():
+    app = make_app()
+
+    params = app.openapi()["paths"]["/add_item"]["post"]["parameters"]
+
+    assert [param["name"] for param in params] == ["item"]
+
+
+def test_disk_backend_round_trip(tmp_path):
+    client = TestClient(make_app(state=DiskStateBackend(str(tmp_path))))
+    client.post("/add_item", params={"item": "a"})
+
+    client = TestClient(make_app(state=DiskStateBackend(str(tmp_path))))
+
+    assert client.post("/add_item", params={"item": "b"}).json() == 2
+
+
+def test_state_without_empty_value_requires_a_default():
+    app = Davia()
+
+    class Required(BaseModel):
+        name: str
+
+    with pytest.raises(TypeError, match="needs a default"):
+
+        @app.task
+        def task(value: Annotated[Required, State("value")]) -> str:
+            return value.name
+
+
+def test_state_shares_the_request_of_the_task():
+    app = Davia()
+
+    @app.task
+    def whoami(request: Request, items: Annotated[list[str], State("items")]) -> str:
+        items.append(request.headers["X-User"])
+        return request.headers["X-User"]
+
+    client = TestClient(app)
+    response = client.post("/whoami", headers={"X-User": "ada"})
+
+    assert response.json() == "ada"
+    assert client.get("/davia/state").json() == {"items": ["ada"]}
+
+
+def test_concurrent_tasks_do_not_lose_updates():
+    app = Davia()
+
+    @app.task
+    async def slow_increment(
+        counter: Annotated[StateHandle[int], State("counter")],
+    ) -> int:
+        value = counter.value
+        await asyncio.sleep(0.01)
+        counter.set(value + 1)
+        return counter.value
+
+    @app.task
+    def sync_increment(counter: Annotated[StateHandle[int], State("counter")]) -> int:
+        counter.set(counter.value + 1)
+        return counter.value
+
+    async def main():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://t") as c:
+            await asyncio.gather(
+                *(c.post("/slow_increment") for _ in range(5)),
+                *(c.post("/sync_increment") for _ in range(5)),
+            )
+            return (await c.get("/davia/state")).json()
+
+    assert asyncio.run(main()) == {"counter": 10}
+
+
+def test_large_values_are_not_sent_in_headers():
+    client = TestClient(make_app())
+
+    response = client.post("/add_item", params={"item": "x" * STATE_DELTA_MAX_SIZE})
+
+    assert response.headers[STATE_CHANGED_HEADER] == "items"
+    assert STATE_DELTA_HEADER not in response.headers
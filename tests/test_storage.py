@@ -0,0 +1,99 @@
+import asyncio
+import uuid
+
+from davia.storage import SqliteDatabase
+
+
+def checkpoints(db: SqliteDatabase):
+    return db.dict(
+        "checkpoints",
+        depth=3,
+        columns=lambda path, value: (path[0], value["run_id"]),
+    )
+
+
+def rows(db: SqliteDatabase, table: str):
+    return db.connection.execute(
+        f"SELECT thread_id, run_id FROM {table} ORDER BY rowid"
+    ).fetchall()
+
+
+def test_nested_dict_round_trip(tmp_path):
+    path = str(tmp_path / "davia.sqlite")
+    db = SqliteDatabase(path)
+    storage = checkpoints(db)
+    storage["t1"][""]["c1"] = {"run_id": "r1"}
+    storage["t1"][""].update({"c2": {"run_id": "r2"}})
+    storage["t2"] = {"": {"c1": {"run_id": "r3"}}}
+    db.close()
+
+    db = SqliteDatabase(path)
+    assert rows(db, "checkpoints") == [("t1", "r1"), ("t1", "r2"), ("t2", "r3")]
+    storage = checkpoints(db)
+    assert storage["t1"][""]["c2"] == {"run_id": "r2"}
+
+    del storage["t1"]
+    db.sync()
+    assert rows(db, "checkpoints") == [("t2", "r3")]
+    db.close()
+
+
+def test_reads_are_not_written_back(tmp_path):
+    db = SqliteDatabase(str(tmp_path / "davia.sqlite"))
+    storage = checkpoints(db)
+    storage["t1"][""]["c1"] = {"run_id": "r1"}
+    db.sync()
+
+    assert storage["t1"][""]["c1"] == {"run_id": "r1"}
+    assert storage["t1"][""].get("missing") is None
+    assert db.changes() == []
+    db.close()
+
+
+def test_ops_store_writes_one_row_per_run(tmp_path):
+    path = str(tmp_path / "davia.sqlite")
+    db = SqliteDatabase(path)
+    store = db.ops_store()
+    thread_id, run_ids = uuid.uuid4(), [uuid.uuid4(), uuid.uuid4()]
+    store["threads"].append({"thread_id": thread_id, "status": "idle"})
+    for run_id in run_ids:
+        store["runs"].append(
+            {"run_id": run_id, "thread_id": thread_id, "status": "pending"}
+        )
+    db.sync()
+
+    store["runs"][0]["status"] = "running"
+    (changes,) = db.changes()
+    assert changes.table is store.tables["runs"]
+    assert list(changes.dirty) == [run_ids[0]]
+    db.write([changes])
+
+    # The runtime deletes runs by assigning a filtered list
+    store["runs"] = [run for run in store["runs"] if run["run_id"] != run_ids[1]]
+    db.close()
+
+    db = SqliteDatabase(path)
+    assert rows(db, "runs") == [(str(thread_id), str(run_ids[0]))]
+    assert rows(db, "threads") == [(str(thread_id), None)]
+    store = db.ops_store()
+    assert store["runs"] == [
+        {"run_id": run_ids[0], "thread_id": thread_id, "status": "running"}
+    ]
+    db.close()
+
+
+def test_flush_loop_writes_in_batches(tmp_path):
+    db = SqliteDatabase(str(tmp_path / "davia.sqlite"))
+    storage = db.dict("settings")
+
+    async def main():
+        flush = asyncio.create_task(db.flush_loop(interval=0.01))
+        storage["a"] = 1
+        storage["b"] = 2
+        await asyncio.sleep(0.1)
+        flush.cancel()
+
+    asyncio.run(main())
+    assert db.changes() == []
+    assert len(rows(db, "settings")) == 2
+    db.close()
@@ -0,0 +1,53 @@
+from davia.sync import StateSync, StateSyncRegistry, make_patch
+
+
+def test_grown_lists_are_patched_by_appending():
+    old = {"messages": ["a"], "count": 1, "draft": "x"}
+    new = {"messages": ["a", "b"], "count": 2}
+
+    assert make_patch(old, new) == [
+        {"op": "remove", "path": "/draft"},
+        {"op": "add", "path": "/messages/-", "value": "b"},
+        {"op": "replace", "path": "/count", "value": 2},
+    ]
+
+
+def test_delta_sends_patches_or_a_snapshot():
+    state = StateSync()
+    assert state.update({"messages": []}) is None
+    state.update({"messages": ["a"]})
+    state.update({"messages": ["a", "b"]})
+    assert state.update({"messages": ["a", "b"]}) is None
+
+    token = state.token
+    assert state.delta(token) == {"version": token, "patch": []}
+    assert state.delta(f"{state.epoch}.1") == {
+        "version": token,
+        "patch": [
+            {"op": "add", "path": "/messages/-", "value": "a"},
+            {"op": "add", "path": "/messages/-", "value": "b"},
+        ],
+    }
+    assert state.delta(None) == {"version": token, "values": {"messages": ["a", "b"]}}
+
+
+def test_versions_of_another_instance_get_a_snapshot():
+    before = StateSync()
+    before.update({"count": 1})
+    # Restarted, or evicted and tracked again
+    after = StateSync()
+    after.update({"count": 2})
+
+    assert after.delta(before.token) == {"version": after.token, "values": {"count": 2}}
+    assert after.delta("1")["values"] == {"count": 2}
+
+
+def test_registry_forgets_least_recently_used_threads():
+    registry = StateSyncRegistry(max_threads=2)
+    first = registry.get("t1")
+    registry.get("t2")
+    registry.get("t1")
+    registry.get("t3")
+
+    assert registry.get("t1") is first
+    assert list(registry._threads) == ["t3", "t1"]
@@ -0,0 +1,30 @@
+from fastapi.testclient import TestClient
+
+from davia import Davia
+
+
+def make_app() -> Davia:
+    app = Davia()
+
+    @app.task
+    def double(value: int) -> int:
+        return value * 2
+
+    return app
+
+
+def test_invalid_frames_keep_the_socket_open():
+    client = TestClient(make_app())
+
+    with client.websocket_connect("/davia/ws") as websocket:
+        websocket.send_bytes(b"\x00")
+        assert websocket.receive_json()["event"] == "error"
+        for message in ['{"id": [1], "task": "double"}', '{"id": {}}', "[]", "{"]:
+            websocket.send_text(message)
+            assert websocket.receive_json() == {
+                "event": "error",
+                "data": {"detail": "Invalid message"},
+            }
+
+        websocket.send_json({"id": 1, "task": "double", "args": {"value": 21}})
+        assert websocket.receive_json() == {"id": 1, "status": 200, "result": 42}